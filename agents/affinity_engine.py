@@ -0,0 +1,168 @@
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from agents.data_store import get_store
+
+METRICS = ("cosine", "lift", "cooccurrence")
+
+# Upper bound on (product, product) pairs materialized at once by cooccurrence_counts
+JOIN_CHUNK = 1 << 22
+# Upper bound on scores held at once while AffinityModel.from_frame picks each product's top-k
+SCORE_BLOCK = 1 << 22
+
+
+def cooccurrence_counts(customer_codes: np.ndarray, product_codes: np.ndarray, n_products: int) -> np.ndarray:
+    """
+    Product x product matrix of how many customers bought both products, i.e.
+    incidence.T @ incidence for the binary customer x product incidence matrix.
+    Works on the deduplicated (customer, product) pairs (the sparse incidence in
+    coordinate form): each customer's products are joined with themselves and
+    the pairs counted, in chunks of whole customers. Besides the products x
+    products result, memory is bounded by JOIN_CHUNK pairs per chunk, and never
+    grows with customers x products.
+    """
+    cooccurrence = np.zeros(n_products * n_products, dtype=np.int64)
+    if n_products == 0 or len(customer_codes) == 0:
+        return cooccurrence.reshape(n_products, n_products)
+    customer_codes = np.asarray(customer_codes, dtype=np.int64)
+    product_codes = np.asarray(product_codes, dtype=np.int64)
+    # Missing IDs or products factorize to -1
+    known = (customer_codes >= 0) & (product_codes >= 0)
+    # Sorted unique keys group each customer's distinct products together
+    keys = np.unique(customer_codes[known] * n_products + product_codes[known])
+    if len(keys) == 0:
+        return cooccurrence.reshape(n_products, n_products)
+    customer, product = keys // n_products, keys % n_products
+    starts = np.flatnonzero(np.r_[True, customer[1:] != customer[:-1]])
+    sizes = np.diff(np.r_[starts, len(keys)])
+
+    # Split customers into chunks whose self-join stays under JOIN_CHUNK pairs
+    joined = np.cumsum(sizes * sizes)
+    first = 0
+    while first < len(starts):
+        last = max(first + 1, int(np.searchsorted(joined, (joined[first - 1] if first else 0) + JOIN_CHUNK, side="right")))
+        chunk_sizes = sizes[first:last]
+        members = np.arange(starts[first], starts[first] + chunk_sizes.sum())
+        # Each member pairs with every member of its customer, itself included
+        repeats = np.repeat(chunk_sizes, chunk_sizes)
+        left = np.repeat(members, repeats)
+        group_start = np.repeat(np.repeat(starts[first:last], chunk_sizes), repeats)
+        offsets = np.arange(len(left)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+        right = group_start + offsets
+        # Only the pairs seen in this chunk are touched; the keys are unique, so += is safe
+        pair_keys, counts = np.unique(product[left] * n_products + product[right], return_counts=True)
+        cooccurrence[pair_keys] += counts
+        first = last
+    return cooccurrence.reshape(n_products, n_products)
+
+
+class AffinityModel:
+    """
+    Co-purchase affinity model built from the purchase data.
+    Holds the top-k related products per product as dense index/score arrays.
+    """
+
+    def __init__(self, products: List[str], top_indices: np.ndarray, top_scores: np.ndarray):
+        self.products = np.asarray(products, dtype=object)
+        self.top_indices = top_indices
+        self.top_scores = top_scores
+        self._index: Dict[str, int] = {product: i for i, product in enumerate(products)}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, top_k: int = 5, metric: str = "cosine") -> "AffinityModel":
+        """
+        Counts co-purchases per product pair (see cooccurrence_counts) and scores them.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown affinity metric {metric}; expected one of {METRICS}")
+        customer_codes, customers = pd.factorize(df["Customer ID"])
+        product_codes, products = pd.factorize(df["Product"])
+        n_customers, n_products = len(customers), len(products)
+        cooccurrence = cooccurrence_counts(customer_codes, product_codes, n_products)
+
+        counts = np.diag(cooccurrence).astype(np.float64)
+
+        # Keep the top-k related products per product, padding with -1. Scores
+        # are computed for a block of rows at a time, never products x products.
+        k = max(0, min(top_k, n_products - 1))
+        if k == 0:
+            return cls(list(products), np.full((n_products, 0), -1), np.zeros((n_products, 0)))
+        top_indices = np.empty((n_products, k), dtype=np.int64)
+        top_scores = np.empty((n_products, k), dtype=np.float64)
+        block = max(1, SCORE_BLOCK // n_products)
+        for first in range(0, n_products, block):
+            rows = np.arange(first, min(first + block, n_products))
+            block_counts = cooccurrence[rows]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                if metric == "cosine":
+                    scores = block_counts / np.sqrt(np.outer(counts[rows], counts))
+                elif metric == "lift":
+                    scores = block_counts * n_customers / np.outer(counts[rows], counts)
+                else:
+                    scores = block_counts.astype(np.float64)
+            scores = np.nan_to_num(scores, nan=0.0, posinf=0.0)
+            scores[np.arange(len(rows)), rows] = 0.0
+            block_indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_indices[rows] = block_indices
+            top_scores[rows] = np.take_along_axis(scores, block_indices, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top_indices = np.take_along_axis(top_indices, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        top_indices[top_scores <= 0] = -1
+        return cls(list(products), top_indices, top_scores)
+
+    def related(self, product: str) -> List[Tuple[str, float]]:
+        """
+        Returns (product, score) pairs most often co-purchased with a product.
+        """
+        i = self._index.get(product)
+        if i is None:
+            return []
+        valid = self.top_indices[i] >= 0
+        return list(zip(self.products[self.top_indices[i][valid]].tolist(), self.top_scores[i][valid].tolist()))
+
+    def suggest(self, products: List[str], k: Optional[int] = None) -> List[str]:
+        """
+        Aggregates the related products of several products, excluding the inputs,
+        ordered by summed affinity score.
+        """
+        rows = [self._index[product] for product in products if product in self._index]
+        if not rows:
+            return []
+        indices = self.top_indices[rows].ravel()
+        scores = self.top_scores[rows].ravel()
+        valid = indices >= 0
+        totals = np.bincount(indices[valid], weights=scores[valid], minlength=len(self.products))
+        totals[rows] = 0.0
+        ranked = np.argsort(-totals, kind="stable")
+        ranked = ranked[totals[ranked] > 0]
+        if k is not None:
+            ranked = ranked[:k]
+        return self.products[ranked].tolist()
+
+
+_model: Optional[AffinityModel] = None
+_model_version = None
+_model_lock = threading.Lock()
+
+
+def get_affinity_model() -> AffinityModel:
+    """
+    Returns the affinity model for the shared purchase store, rebuilding it when the data changes.
+    Top-k and scoring metric come from $AFFINITY_TOP_K and $AFFINITY_METRIC.
+    """
+    global _model, _model_version
+    store = get_store()
+    version = store.version
+    if _model is None or version != _model_version:
+        with _model_lock:
+            if _model is None or version != _model_version:
+                _model = AffinityModel.from_frame(
+                    store.frame(columns=["Customer ID", "Product"]),
+                    top_k=int(os.getenv("AFFINITY_TOP_K", "5")),
+                    metric=os.getenv("AFFINITY_METRIC", "cosine")
+                )
+                _model_version = version
+    return _model
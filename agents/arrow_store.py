@@ -0,0 +1,167 @@
+import argparse
+import hashlib
+import os
+import threading
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:
+    pa = None
+
+KEY_COLUMN = "_key"
+INDEX_SUFFIX = ".index"
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("The memory-mapped data backend requires pyarrow (pip install pyarrow)")
+
+
+def customer_key(customer_id: str) -> int:
+    """
+    Stable 64-bit key for a customer ID; rows and the index are sorted by it.
+    """
+    return int.from_bytes(hashlib.blake2b(customer_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _write_ipc(table, path: str) -> None:
+    # Uncompressed, so readers can map the buffers without decoding them
+    tmp_path = path + ".tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def export_arrow(df: pd.DataFrame, path: str) -> int:
+    """
+    Writes purchase rows to an Arrow IPC file that processes can memory-map.
+    Rows are grouped by customer (keeping their original order) and a small
+    index file maps each customer key to its row range. Returns the row count.
+    """
+    _require_pyarrow()
+    customer_ids = df["Customer ID"].astype(str)
+    codes, uniques = pd.factorize(customer_ids, sort=False)
+    unique_keys = np.array([customer_key(customer_id) for customer_id in uniques], dtype=np.uint64)
+    row_keys = unique_keys[codes]
+    order = np.argsort(row_keys, kind="stable")
+
+    table = pa.Table.from_pandas(df.assign(**{"Customer ID": customer_ids}), preserve_index=False).take(pa.array(order))
+    table = table.append_column(KEY_COLUMN, pa.array(row_keys[order]))
+
+    sorted_keys = row_keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    lengths = np.diff(np.r_[starts, len(sorted_keys)])
+    index = pa.table({
+        KEY_COLUMN: pa.array(sorted_keys[starts]),
+        "Customer ID": table.column("Customer ID").take(pa.array(starts)),
+        "start": pa.array(starts, type=pa.int64()),
+        "length": pa.array(lengths, type=pa.int64())
+    })
+
+    # Index first: a reader that sees the new data file always finds a matching index
+    _write_ipc(index, path + INDEX_SUFFIX)
+    _write_ipc(table, path)
+    return table.num_rows
+
+
+class _MappedData:
+    """
+    One mapped version of the data file and its index.
+    """
+
+    def __init__(self, mtime: float, table, index):
+        self.mtime = mtime
+        self.table = table
+        self.index = index
+        self.index_keys: np.ndarray = index.column(KEY_COLUMN).to_numpy()
+
+
+class MappedPurchaseStore:
+    """
+    Reads an Arrow IPC file written by export_arrow through a memory map. Every
+    process mapping the file shares the same page-cache pages, so worker count
+    does not multiply the dataset's memory. Per-customer reads are zero-copy
+    slices until converted to pandas. Remaps when the file is replaced.
+    """
+
+    def __init__(self, data_file: str):
+        _require_pyarrow()
+        self.data_file = data_file
+        self._lock = threading.Lock()
+        self._data: Optional[_MappedData] = None
+
+    def _load(self, mtime: float) -> _MappedData:
+        index = ipc.open_file(pa.memory_map(self.data_file + INDEX_SUFFIX)).read_all()
+        table = ipc.open_file(pa.memory_map(self.data_file)).read_all()
+        # Published in one assignment, so readers never see a table with another version's index
+        self._data = _MappedData(mtime, table, index)
+        return self._data
+
+    def _refresh(self) -> _MappedData:
+        # Readers take the returned snapshot once and use only it for the rest of the call
+        mtime = os.path.getmtime(self.data_file)
+        data = self._data
+        if data is not None and data.mtime == mtime:
+            return data
+        with self._lock:
+            data = self._data
+            if data is not None and data.mtime == mtime:
+                return data
+            return self._load(mtime)
+
+    @staticmethod
+    def _columns(data: _MappedData, columns: Optional[List[str]]) -> List[str]:
+        return [c for c in data.table.column_names if c != KEY_COLUMN] if columns is None else columns
+
+    def exists(self) -> bool:
+        return os.path.exists(self.data_file)
+
+    def frame(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Returns purchase rows limited to columns (this copies them out of the map).
+        """
+        data = self._refresh()
+        return data.table.select(self._columns(data, columns)).to_pandas()
+
+    def customer_rows(self, customer_id: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        """
+        Returns a customer's purchase rows limited to columns, or None if unknown.
+        """
+        data = self._refresh()
+        key = np.uint64(customer_key(customer_id))
+        position = int(np.searchsorted(data.index_keys, key))
+        # Walk past (vanishingly rare) key collisions to the matching ID
+        while position < len(data.index_keys) and data.index_keys[position] == key:
+            if data.index.column("Customer ID")[position].as_py() == customer_id:
+                start = data.index.column("start")[position].as_py()
+                length = data.index.column("length")[position].as_py()
+                return data.table.slice(start, length).select(self._columns(data, columns)).to_pandas()
+            position += 1
+        return None
+
+    @property
+    def version(self) -> Optional[float]:
+        if not self.exists():
+            return None
+        return self._refresh().mtime
+
+    def customer_ids(self) -> list:
+        return self._refresh().index.column("Customer ID").to_pylist()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export purchase data to a memory-mappable Arrow file.")
+    parser.add_argument("source", help="Purchase CSV or Parquet dataset directory")
+    parser.add_argument("path", help="Output .arrow file")
+    args = parser.parse_args()
+    from agents.data_store import get_store
+    rows = export_arrow(get_store(args.source).frame(), args.path)
+    print(f"Wrote {rows} rows to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
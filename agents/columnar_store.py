@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import zlib
+from typing import Dict, List, Optional
+import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+MANIFEST = "_manifest.json"
+CUSTOMERS_FILE = "customers.parquet"
+PURCHASES_DIR = "purchases"
+
+# Purchase facts; every other CSV column is a per-customer attribute
+PURCHASE_COLUMNS = ["Customer ID", "Product", "Quantity", "Unit Price (USD)", "Total Price (USD)", "Purchase Date"]
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("The Parquet data backend requires pyarrow (pip install pyarrow)")
+
+
+def customer_bucket(customer_id: str, partitions: int) -> int:
+    """
+    Stable hash partition for a customer ID.
+    """
+    return zlib.crc32(customer_id.encode("utf-8")) % partitions
+
+
+def ingest_csv(csv_path: str, dataset_dir: str, partitions: int = 16) -> Dict[str, int]:
+    """
+    Converts the purchase CSV into a normalized Parquet dataset: a customer
+    dimension table and a purchases fact table hash-partitioned by Customer ID.
+    The new dataset replaces dataset_dir only once it is fully written.
+    """
+    _require_pyarrow()
+    table = pa_csv.read_csv(
+        csv_path,
+        convert_options=pa_csv.ConvertOptions(column_types={"Customer ID": pa.string()})
+    )
+    customer_columns = [c for c in table.column_names if c not in PURCHASE_COLUMNS or c == "Customer ID"]
+
+    customers = (
+        table.select(customer_columns).to_pandas()
+        .drop_duplicates("Customer ID", keep="first")
+        .sort_values("Customer ID")
+    )
+    purchases = table.select([c for c in PURCHASE_COLUMNS if c in table.column_names])
+    buckets = pa.array(
+        [customer_bucket(customer_id, partitions) for customer_id in purchases.column("Customer ID").to_pylist()],
+        type=pa.int32()
+    )
+    purchases = purchases.append_column("bucket", buckets).sort_by([("bucket", "ascending"), ("Customer ID", "ascending")])
+
+    staging_dir = dataset_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    pq.write_table(pa.Table.from_pandas(customers, preserve_index=False), os.path.join(staging_dir, CUSTOMERS_FILE))
+    # Sorted by Customer ID so row-group statistics let readers skip other customers
+    pq.write_to_dataset(
+        purchases,
+        os.path.join(staging_dir, PURCHASES_DIR),
+        partition_cols=["bucket"],
+        row_group_size=64 * 1024
+    )
+    with open(os.path.join(staging_dir, MANIFEST), "w") as f:
+        json.dump({
+            "partitions": partitions,
+            "customer_columns": customer_columns,
+            "purchase_columns": purchases.column_names[:-1]
+        }, f)
+
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+    os.replace(staging_dir, dataset_dir)
+    return {"customers": len(customers), "purchases": purchases.num_rows}
+
+
+class _Dataset:
+    """
+    One loaded version of the dataset: its manifest, customer table and purchases.
+    """
+
+    def __init__(self, mtime: float, partitions: int, customer_columns: List[str], customers: pd.DataFrame, purchases):
+        self.mtime = mtime
+        self.partitions = partitions
+        self.customer_columns = customer_columns
+        self.customers = customers
+        self.purchases = purchases
+
+
+class ParquetPurchaseStore:
+    """
+    Reads the normalized Parquet dataset written by ingest_csv. Only the requested
+    columns are read, and per-customer reads push the Customer ID predicate down
+    to the partition and row-group level. Reloads when the dataset is re-ingested.
+    """
+
+    def __init__(self, dataset_dir: str):
+        _require_pyarrow()
+        self.data_file = dataset_dir
+        self._lock = threading.Lock()
+        self._dataset: Optional[_Dataset] = None
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.data_file, MANIFEST)
+
+    def _load(self, mtime: float) -> _Dataset:
+        with open(self._manifest_path()) as f:
+            manifest = json.load(f)
+        customers = pd.read_parquet(os.path.join(self.data_file, CUSTOMERS_FILE)).set_index("Customer ID", drop=False)
+        purchases = ds.dataset(
+            os.path.join(self.data_file, PURCHASES_DIR),
+            format="parquet",
+            partitioning=ds.partitioning(pa.schema([("bucket", pa.int32())]), flavor="hive")
+        )
+        # Published in one assignment, so readers never mix two ingests
+        self._dataset = _Dataset(mtime, manifest["partitions"], manifest["customer_columns"], customers, purchases)
+        return self._dataset
+
+    def _refresh(self) -> _Dataset:
+        # Readers take the returned snapshot once and use only it for the rest of the call
+        mtime = os.path.getmtime(self._manifest_path())
+        dataset = self._dataset
+        if dataset is not None and dataset.mtime == mtime:
+            return dataset
+        with self._lock:
+            dataset = self._dataset
+            if dataset is not None and dataset.mtime == mtime:
+                return dataset
+            return self._load(mtime)
+
+    @staticmethod
+    def _split_columns(dataset: _Dataset, columns: Optional[List[str]]):
+        names = dataset.purchases.schema.names
+        if columns is None:
+            columns = dataset.customer_columns + [c for c in names if c not in ("Customer ID", "bucket")]
+        fact_columns = [c for c in columns if c in names and c not in dataset.customer_columns]
+        dim_columns = [c for c in columns if c in dataset.customer_columns]
+        return columns, fact_columns, dim_columns
+
+    def exists(self) -> bool:
+        return os.path.exists(self._manifest_path())
+
+    def frame(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Returns purchase rows joined with customer attributes, limited to columns.
+        """
+        dataset = self._refresh()
+        columns, fact_columns, dim_columns = self._split_columns(dataset, columns)
+        purchases = dataset.purchases.to_table(columns=["Customer ID"] + fact_columns).to_pandas()
+        extra = [c for c in dim_columns if c != "Customer ID"]
+        if extra:
+            purchases = purchases.join(dataset.customers[extra], on="Customer ID")
+        return purchases[columns]
+
+    def customer_rows(self, customer_id: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        """
+        Returns a customer's purchase rows limited to columns, or None if unknown.
+        """
+        dataset = self._refresh()
+        if customer_id not in dataset.customers.index:
+            return None
+        columns, fact_columns, dim_columns = self._split_columns(dataset, columns)
+        bucket = customer_bucket(customer_id, dataset.partitions)
+        rows = dataset.purchases.to_table(
+            columns=["Customer ID"] + fact_columns,
+            filter=(ds.field("bucket") == bucket) & (ds.field("Customer ID") == customer_id)
+        ).to_pandas()
+        customer = dataset.customers.loc[customer_id]
+        for column in dim_columns:
+            if column != "Customer ID":
+                rows[column] = customer[column]
+        return rows[columns]
+
+    @property
+    def version(self) -> Optional[float]:
+        if not self.exists():
+            return None
+        return self._refresh().mtime
+
+    def customer_ids(self) -> list:
+        return self._refresh().customers.index.tolist()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest the purchase CSV into a partitioned Parquet dataset.")
+    parser.add_argument("csv_path")
+    parser.add_argument("dataset_dir")
+    parser.add_argument("--partitions", type=int, default=16)
+    args = parser.parse_args()
+    counts = ingest_csv(args.csv_path, args.dataset_dir, args.partitions)
+    print(f"Wrote {counts['customers']} customers and {counts['purchases']} purchases to {args.dataset_dir}")
+
+
+if __name__ == "__main__":
+    main()
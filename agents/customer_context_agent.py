@@ -1,24 +1,16 @@
-import pandas as pd
-import os
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from langchain.prompts import PromptTemplate
-from dotenv import load_dotenv
-try:
-    from langchain_google_genai import ChatGoogleGenerativeAI
-except ImportError:
-    from langchain_community.llms import FakeListLLM
+from agents.llm_provider import get_llm, register_fake_responses
+from agents.llm_cache import cached_invoke, acached_invoke
+from agents.pipeline_mode import uses_llm
+from agents.metrics import record_fallback
+from agents.resilience import LLMUnavailableError
+from agents.structured_output import CustomerProfile, parse_output, conforms
+from agents.data_store import get_store
+from agents.concurrency import run_blocking
 
-load_dotenv()
-
-# Initialize LLM
-try:
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-1.5-flash",
-        google_api_key=os.getenv("GOOGLE_API_KEY"),
-        temperature=0.7
-    )
-except Exception:
-    llm = FakeListLLM(responses=["{'customer_id': 'C001', 'customer_name': 'Edge Communications', 'industry': 'Electronics', 'revenue': 139000000.0, 'number_of_employees': 1000, 'location': 'Austin, TX, USA', 'recent_purchases': ['Drill Bits', 'Protective Gloves', 'Generators', 'Workflow Automation']}"] * 10)
+# Canned response for the local fake model (see agents.llm_provider)
+register_fake_responses("customer_context", ["{'customer_id': 'C001', 'customer_name': 'Edge Communications', 'industry': 'Electronics', 'revenue': 139000000.0, 'number_of_employees': 1000, 'location': 'Austin, TX, USA', 'recent_purchases': ['Drill Bits', 'Protective Gloves', 'Generators', 'Workflow Automation']}"])
 
 # Prompt to format customer profile
 profile_prompt = PromptTemplate(
@@ -26,41 +18,93 @@ profile_prompt = PromptTemplate(
     template="Format the following customer data into a structured profile:\n{customer_data}\nOutput a JSON-like dictionary with customer_id, customer_name, industry, revenue, number_of_employees, location, recent_purchases."
 )
 
-def get_customer_profile(customer_id: str) -> Dict[str, Any]:
+# Only these columns are read from the purchase store
+PROFILE_COLUMNS = ["Customer Name", "Industry", "Annual Revenue (USD)", "Number of Employees", "Location", "Product"]
+
+def _load_profile(customer_id: str) -> Dict[str, Any]:
     """
-    Extracts a customer profile dict from CSV by customer_id.
-    Uses LangChain to format the output.
+    Builds the unformatted profile dict from the shared purchase store.
     """
-    try:
-        data_file = os.getenv("DATA_FILE", "data/customer_data_purchases.csv")
-        if not os.path.exists(data_file):
-            return {"error": f"CSV file {data_file} not found"}
+    store = get_store()
+    if not store.exists():
+        return {"error": f"Data file {store.data_file} not found"}
+
+    customer_rows = store.customer_rows(customer_id, columns=PROFILE_COLUMNS)
+
+    if customer_rows is None or customer_rows.empty:
+        return {"error": f"Customer ID {customer_id} not found"}
 
-        df = pd.read_csv(data_file)
-        customer_rows = df[df["Customer ID"] == customer_id]
+    first = customer_rows.iloc[0]
+    return {
+        "customer_id": customer_id,
+        "customer_name": first.get("Customer Name", "Unknown"),
+        "industry": first.get("Industry", "Unknown"),
+        "revenue": first.get("Annual Revenue (USD)", 0.0),
+        "number_of_employees": first.get("Number of Employees", 0),
+        "location": first.get("Location", "Unknown"),
+        "recent_purchases": list(customer_rows["Product"].unique())
+    }
 
-        if customer_rows.empty:
-            return {"error": f"Customer ID {customer_id} not found"}
+# Identity and purchase history always come from the purchase data, whatever the model says
+STORE_FIELDS = ("customer_id", "recent_purchases")
 
-        first = customer_rows.iloc[0]
-        profile = {
-            "customer_id": customer_id,
-            "customer_name": first.get("Customer Name", "Unknown"),
-            "industry": first.get("Industry", "Unknown"),
-            "revenue": first.get("Annual Revenue (USD)", 0.0),
-            "number_of_employees": first.get("Number of Employees", 0),
-            "location": first.get("Location", "Unknown"),
-            "recent_purchases": list(customer_rows["Product"].unique())
-        }
+def _parse_profile(formatted_profile: str, profile: Dict[str, Any]) -> Dict[str, Any]:
+    parsed = parse_output(formatted_profile, CustomerProfile, "customer_context")
+    if parsed is None or (parsed.customer_id is not None and parsed.customer_id != profile["customer_id"]):
+        # A profile describing another customer is worse than the unformatted one
+        record_fallback("customer_context")
+        return profile
+    # Fields the model left out keep their values from the purchase data
+    formatted = {**profile, **parsed.model_dump(exclude_none=True)}
+    formatted.update({field: profile[field] for field in STORE_FIELDS})
+    return formatted
+
+def get_customer_profile(customer_id: str, mode: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Extracts a customer profile dict from the shared purchase store by customer_id.
+    Uses LangChain to format the output unless the mode skips the LLM.
+    """
+    try:
+        profile = _load_profile(customer_id)
+        if "error" in profile or not uses_llm("customer_context", mode):
+            return profile
 
         # Use LangChain to format
-        formatted_profile = llm.invoke(
-            profile_prompt.format(customer_data=str(profile))
-        ).content
         try:
-            return eval(formatted_profile)
-        except:
+            formatted_profile = cached_invoke(
+                get_llm("customer_context"),
+                profile_prompt.format(customer_data=str(profile)),
+                agent="customer_context",
+                accept=lambda text: conforms(text, CustomerProfile)
+            )
+        except LLMUnavailableError:
+            record_fallback("customer_context")
+            return profile
+        return _parse_profile(formatted_profile, profile)
+
+    except Exception as e:
+        return {"error": f"Failed to retrieve profile: {str(e)}"}
+
+async def aget_customer_profile(customer_id: str, mode: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Async variant of get_customer_profile; store access runs on the blocking I/O executor.
+    """
+    try:
+        profile = await run_blocking(_load_profile, customer_id)
+        if "error" in profile or not uses_llm("customer_context", mode):
+            return profile
+
+        try:
+            formatted_profile = await acached_invoke(
+                get_llm("customer_context"),
+                profile_prompt.format(customer_data=str(profile)),
+                agent="customer_context",
+                accept=lambda text: conforms(text, CustomerProfile)
+            )
+        except LLMUnavailableError:
+            record_fallback("customer_context")
             return profile
+        return _parse_profile(formatted_profile, profile)
 
     except Exception as e:
-        return {"error": f"Failed to retrieve profile: {str(e)}"}
\ No newline at end of file
+        return {"error": f"Failed to retrieve profile: {str(e)}"}
@@ -0,0 +1,229 @@
+import threading
+from itertools import chain
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from agents.data_store import get_store
+from agents.affinity_engine import cooccurrence_counts
+
+COLUMNS = [
+    "Customer ID", "Product", "Quantity", "Total Price (USD)", "Annual Revenue (USD)",
+    "Customer Priority", "Rating", "Product Usage (%)", "Last Activity Date"
+]
+
+# Every feature is scaled to [0, 1]; 0.5 stands for unknown
+FEATURES = ("usage", "priority", "rating", "revenue", "quantity", "spend", "recency")
+FEATURE_WEIGHTS = np.array([0.25, 0.15, 0.2, 0.1, 0.1, 0.1, 0.1], dtype=np.float32)
+
+PRIORITY_LEVELS = {"Low": 0.0, "Medium": 0.5, "High": 1.0}
+RATING_LEVELS = {"Cold": 0.0, "Warm": 0.5, "Hot": 1.0}
+
+# Days of inactivity after which recency has decayed to 1/e
+RECENCY_DAYS = 90.0
+
+CROSS_SELL_BASE = 0.8
+UPSELL_BASE = 0.6
+# How far customer propensity moves a score from its base (+/- half of this)
+PROPENSITY_SPREAD = 0.3
+# Bonus for products many other customers already own
+POPULARITY_WEIGHT = 0.1
+# Bonus for products that owners of the customer's products also bought
+COPURCHASE_WEIGHT = 0.2
+
+
+def _scale(values: np.ndarray) -> np.ndarray:
+    # Min-max scaling over all customers; constant or missing values map to 0.5
+    values = values.astype(np.float64)
+    finite = np.isfinite(values)
+    if not finite.any():
+        return np.full(len(values), 0.5)
+    low, high = values[finite].min(), values[finite].max()
+    scaled = (values - low) / (high - low) if high > low else np.full(len(values), 0.5)
+    return np.where(finite, scaled, 0.5)
+
+
+def _levels(column: pd.Series, levels: Dict[str, float]) -> np.ndarray:
+    return column.astype(str).str.strip().str.title().map(levels).to_numpy(dtype=np.float64)
+
+
+class CustomerFeatures:
+    """
+    Per-customer feature vectors (one float32 row of FEATURES per customer) and
+    an integer-coded product catalog, used to score opportunities without an LLM.
+    copurchase[a, b] is the share of product a's owners who also own product b.
+    """
+
+    def __init__(self, customer_ids: List[str], features: np.ndarray, products: List[str], popularity: np.ndarray, copurchase: np.ndarray):
+        self.customer_ids = customer_ids
+        self.features = features
+        self.products = products
+        self.popularity = popularity
+        self.copurchase = copurchase
+        self._customer_index: Dict[str, int] = {customer_id: i for i, customer_id in enumerate(customer_ids)}
+        self._product_index: Dict[str, int] = {product: i for i, product in enumerate(products)}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "CustomerFeatures":
+        """
+        Encodes the purchase rows into one feature vector per customer. Account
+        level columns are taken from the customer's first row; quantity and spend
+        are summed over all of the customer's purchases.
+        """
+        customer_codes, customers = pd.factorize(df["Customer ID"].astype(str))
+        n_customers = len(customers)
+        # np.unique returns each code's first row; factorize codes follow first appearance
+        _, first = np.unique(customer_codes, return_index=True)
+
+        usage = pd.to_numeric(df["Product Usage (%)"], errors="coerce").to_numpy(dtype=np.float64)[first] / 100.0
+        usage = np.where(np.isfinite(usage), np.clip(usage, 0.0, 1.0), 0.5)
+        priority = np.nan_to_num(_levels(df["Customer Priority"], PRIORITY_LEVELS)[first], nan=0.5)
+        rating = np.nan_to_num(_levels(df["Rating"], RATING_LEVELS)[first], nan=0.5)
+        revenue = pd.to_numeric(df["Annual Revenue (USD)"], errors="coerce").to_numpy(dtype=np.float64)[first]
+        quantity = pd.to_numeric(df["Quantity"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+        spend = pd.to_numeric(df["Total Price (USD)"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+
+        activity = pd.to_datetime(df["Last Activity Date"], errors="coerce")
+        last_activity = activity.groupby(customer_codes).max().reindex(range(n_customers))
+        idle_days = (last_activity.max() - last_activity).dt.days.to_numpy(dtype=np.float64)
+        recency = np.where(np.isfinite(idle_days), np.exp(-np.nan_to_num(idle_days) / RECENCY_DAYS), 0.5)
+
+        features = np.column_stack([
+            usage,
+            priority,
+            rating,
+            _scale(np.log1p(np.clip(revenue, 0, None))),
+            _scale(np.log1p(np.bincount(customer_codes, weights=np.clip(quantity, 0, None), minlength=n_customers))),
+            _scale(np.log1p(np.bincount(customer_codes, weights=np.clip(spend, 0, None), minlength=n_customers))),
+            recency
+        ]).astype(np.float32)
+
+        # Sorted catalog so product codes do not depend on row order
+        products = sorted(df["Product"].dropna().astype(str).unique().tolist())
+        product_codes = pd.Categorical(df["Product"].astype(str), categories=products).codes.astype(np.int64)
+        cooccurrence = cooccurrence_counts(customer_codes, product_codes, len(products))
+        # The diagonal counts each product's owners
+        owners = np.diag(cooccurrence).astype(np.float64)
+        popularity = (owners / max(n_customers, 1)).astype(np.float32)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            copurchase = np.nan_to_num(cooccurrence / owners[:, None]).astype(np.float32)
+        np.fill_diagonal(copurchase, 0.0)
+        return cls(customers.tolist(), features, products, popularity, copurchase)
+
+    def rows(self, customer_ids: List[Optional[str]]) -> np.ndarray:
+        # Row of each customer in features; -1 for unknown customers
+        return np.fromiter((self._customer_index.get(str(c), -1) if c is not None else -1 for c in customer_ids), dtype=np.int64, count=len(customer_ids))
+
+    def vectors(self, customer_ids: List[Optional[str]]) -> np.ndarray:
+        """
+        Feature matrix for customer_ids, with neutral (0.5) rows for unknown customers.
+        """
+        rows = self.rows(customer_ids)
+        if not len(self.features):
+            return np.full((len(rows), len(FEATURES)), 0.5, dtype=np.float32)
+        vectors = self.features[np.maximum(rows, 0)]
+        vectors[rows < 0] = 0.5
+        return vectors
+
+    def vector(self, customer_id: str) -> Dict[str, float]:
+        return dict(zip(FEATURES, self.vectors([customer_id])[0].tolist()))
+
+    def score(
+        self,
+        customer_ids: List[Optional[str]],
+        missing_products: List[List[str]],
+        affinity_products: List[List[str]],
+        purchased_products: List[List[str]]
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Scores and ranks the candidate products of many customers at once.
+        Candidates are missing (cross-sell) and affinity (upsell) products not
+        already purchased. Each gets its base score, moved up or down by the
+        customer's weighted feature propensity, plus a product popularity bonus
+        and a co-purchase bonus: how often, on average, the owners of each of
+        the customer's purchased products also bought the candidate.
+        Returns each customer's opportunities ordered by descending score.
+        """
+        # Products outside the catalog get columns of their own for this call
+        codes = dict(self._product_index)
+        names = list(self.products)
+
+        def encode(products: List[str]) -> List[int]:
+            encoded = []
+            for product in products or []:
+                code = codes.get(product)
+                if code is None:
+                    code = codes[product] = len(names)
+                    names.append(product)
+                encoded.append(code)
+            return encoded
+
+        n = len(customer_ids)
+        missing = [encode(products) for products in missing_products]
+        affinity = [encode(products) for products in affinity_products]
+        purchased = [encode(products) for products in purchased_products]
+        width = len(names)
+
+        def mask(lists: List[List[int]]) -> np.ndarray:
+            result = np.zeros((n, width), dtype=bool)
+            rows = np.repeat(np.arange(n), [len(row) for row in lists])
+            columns = np.fromiter(chain.from_iterable(lists), dtype=np.int64, count=len(rows))
+            result[rows, columns] = True
+            return result
+
+        cross_sell = mask(missing)
+        owned = mask(purchased)
+        candidates = (cross_sell | mask(affinity)) & ~owned
+
+        propensity = self.vectors(customer_ids) @ FEATURE_WEIGHTS
+        popularity = np.zeros(width, dtype=np.float32)
+        popularity[:len(self.popularity)] = self.popularity
+        # Only catalog products have co-purchase data
+        catalog = len(self.products)
+        owned_catalog = owned[:, :catalog].astype(np.float32)
+        copurchase = np.zeros((n, width), dtype=np.float32)
+        copurchase[:, :catalog] = (owned_catalog @ self.copurchase) / np.maximum(owned_catalog.sum(axis=1), 1.0)[:, None]
+        scores = (
+            np.where(cross_sell, CROSS_SELL_BASE, UPSELL_BASE)
+            + PROPENSITY_SPREAD * (propensity[:, None] - 0.5)
+            + POPULARITY_WEIGHT * popularity[None, :]
+            + COPURCHASE_WEIGHT * copurchase
+        )
+        # Ranked before clipping, so candidates that both reach 1.0 keep their order
+        scores[~candidates] = -np.inf
+        order = np.argsort(-scores, axis=1, kind="stable")
+        scores = np.round(np.clip(scores, 0.0, 1.0), 3)
+        counts = candidates.sum(axis=1)
+
+        names_array = np.asarray(names, dtype=object)
+        results = []
+        for i in range(n):
+            ranked = order[i, :counts[i]]
+            results.append([
+                {
+                    "product": product,
+                    "score": score,
+                    "rationale": "Cross-sell opportunity based on industry patterns" if cross else "Upsell opportunity based on product affinity"
+                }
+                for product, score, cross in zip(names_array[ranked].tolist(), scores[i, ranked].tolist(), cross_sell[i, ranked].tolist())
+            ])
+        return results
+
+
+_features: Optional[CustomerFeatures] = None
+_features_version = None
+_features_lock = threading.Lock()
+
+
+def get_customer_features() -> CustomerFeatures:
+    """
+    Returns the feature vectors for the shared purchase store, rebuilding them when the data changes.
+    """
+    global _features, _features_version
+    store = get_store()
+    version = store.version
+    if _features is None or version != _features_version:
+        with _features_lock:
+            if _features is None or version != _features_version:
+                _features = CustomerFeatures.from_frame(store.frame(columns=COLUMNS))
+                _features_version = version
+    return _features
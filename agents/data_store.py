@@ -0,0 +1,102 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional
+import pandas as pd
+from agents.columnar_store import ParquetPurchaseStore
+from agents.arrow_store import MappedPurchaseStore
+
+DEFAULT_DATA_FILE = "data/customer_data_purchases.csv"
+
+
+class PurchaseStore:
+    """
+    Loads the purchase CSV once and indexes rows by Customer ID.
+    Reloads automatically when the file's mtime changes.
+    """
+
+    def __init__(self, data_file: str):
+        self.data_file = data_file
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._df: Optional[pd.DataFrame] = None
+        self._by_customer: Dict[str, pd.DataFrame] = {}
+
+    def _load(self, mtime: float) -> None:
+        df = pd.read_csv(self.data_file)
+        by_customer = {
+            str(customer_id): rows.reset_index(drop=True)
+            for customer_id, rows in df.groupby("Customer ID", sort=False)
+        }
+        self._df = df
+        self._by_customer = by_customer
+        self._mtime = mtime
+
+    def _refresh(self) -> None:
+        mtime = os.path.getmtime(self.data_file)
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime != self._mtime:
+                self._load(mtime)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.data_file)
+
+    def frame(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Returns the full purchase DataFrame, optionally limited to columns.
+        """
+        self._refresh()
+        return self._df if columns is None else self._df[columns]
+
+    def customer_rows(self, customer_id: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        """
+        Returns the purchase rows for a customer, or None if unknown.
+        """
+        self._refresh()
+        rows = self._by_customer.get(customer_id)
+        if rows is None or columns is None:
+            return rows
+        return rows[columns]
+
+    @property
+    def version(self) -> Optional[float]:
+        """
+        Identifies the loaded data (its mtime); changes whenever the store reloads.
+        None while the data file is missing.
+        """
+        if not self.exists():
+            return None
+        self._refresh()
+        return self._mtime
+
+    def customer_ids(self) -> list:
+        self._refresh()
+        return list(self._by_customer.keys())
+
+
+_stores: Dict[str, Any] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(data_file: Optional[str] = None) -> Any:
+    """
+    Returns the shared store for a data file (defaults to $DATA_FILE). A directory
+    is read as a Parquet dataset written by agents.columnar_store.ingest_csv, and
+    an .arrow file is memory-mapped (see agents.arrow_store.export_arrow).
+    """
+    if data_file is None:
+        data_file = os.getenv("DATA_FILE", DEFAULT_DATA_FILE)
+    store = _stores.get(data_file)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(data_file)
+            if store is None:
+                if os.path.isdir(data_file):
+                    store_class = ParquetPurchaseStore
+                elif data_file.endswith(".arrow"):
+                    store_class = MappedPurchaseStore
+                else:
+                    store_class = PurchaseStore
+                store = _stores[data_file] = store_class(data_file)
+    return store
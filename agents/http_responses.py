@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed; compressing them costs more than it saves
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Compact JSON bytes, with orjson when installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS, default=str)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson (or compact standard-library JSON).
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def parse_fields(fields: Optional[str], allowed: List[str]) -> Optional[Set[str]]:
+    """
+    Parses a comma-separated fields= parameter; None selects every field.
+    Raises ValueError for a field outside allowed.
+    """
+    if not fields:
+        return None
+    wanted = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = wanted - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields {sorted(unknown)}; expected a subset of {allowed}")
+    return wanted
+
+
+def project(content: Dict[str, Any], wanted: Optional[Set[str]], keep: Tuple[str, ...] = ("error",)) -> Dict[str, Any]:
+    # Keys in keep (an error by default) are returned whatever was selected
+    if wanted is None:
+        return content
+    return {key: value for key, value in content.items() if key in wanted or key in keep}
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    encodings: Dict[str, float] = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    """
+    Picks br (when brotli is installed) or gzip from an Accept-Encoding header.
+    """
+    accepted = _accepted_encodings(header)
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return any(
+        (tag[2:] if tag.startswith("W/") else tag) == bare
+        for tag in (part.strip() for part in if_none_match.split(","))
+    )
+
+
+def conditional_json(request: Request, content: Any, tagged: Any = None) -> Response:
+    """
+    Serializes content once and tags it with an ETag hashed from the JSON of
+    tagged (default: content itself; pass content minus fields that change on
+    every request). Answers 304 when If-None-Match already names it, otherwise
+    compresses bodies of at least $COMPRESS_MIN_BYTES with br or gzip, as the
+    client accepts. The ETag is weak because the same JSON is served under
+    several encodings.
+    """
+    body = dumps(content)
+    digest = hashlib.blake2b(body if tagged is None else dumps(tagged), digest_size=16).hexdigest()
+    etag = f'W/"{digest}"'
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    encoding = choose_encoding(request.headers.get("accept-encoding", "")) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding == "br":
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,66 @@
+import json
+import os
+from typing import Dict, List
+
+# Rough size of a token for Gemini-style tokenizers on English/JSON text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def max_prompt_tokens() -> int:
+    return int(os.getenv("LLM_BATCH_MAX_PROMPT_TOKENS", "16000"))
+
+
+def max_output_tokens() -> int:
+    return int(os.getenv("LLM_BATCH_MAX_OUTPUT_TOKENS", "4096"))
+
+
+def max_batch_customers() -> int:
+    return int(os.getenv("LLM_BATCH_MAX_CUSTOMERS", "25"))
+
+
+def plan_batches(payloads: Dict[str, str], prompt_overhead: int, output_tokens: Dict[str, int]) -> List[List[str]]:
+    """
+    Greedily packs customer keys into batches whose estimated prompt size and
+    expected response size stay under $LLM_BATCH_MAX_PROMPT_TOKENS and
+    $LLM_BATCH_MAX_OUTPUT_TOKENS, with at most $LLM_BATCH_MAX_CUSTOMERS per batch.
+    A customer too large for any batch still gets a batch of its own.
+    """
+    prompt_budget = max_prompt_tokens() - prompt_overhead
+    output_budget = max_output_tokens()
+    limit = max(1, max_batch_customers())
+
+    batches: List[List[str]] = []
+    current: List[str] = []
+    prompt_used = output_used = 0
+    for key, payload in payloads.items():
+        prompt_cost = estimate_tokens(format_line(key, payload))
+        output_cost = output_tokens.get(key, 0)
+        if current and (
+            len(current) >= limit
+            or prompt_used + prompt_cost > prompt_budget
+            or output_used + output_cost > output_budget
+        ):
+            batches.append(current)
+            current, prompt_used, output_used = [], 0, 0
+        current.append(key)
+        prompt_used += prompt_cost
+        output_used += output_cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def format_line(key: str, payload: str) -> str:
+    return f"{json.dumps(key)}: {payload}"
+
+
+def format_batch(payloads: Dict[str, str], keys: List[str]) -> str:
+    """
+    One line per customer: the JSON-quoted key, then its JSON payload.
+    """
+    return "\n".join(format_line(key, payloads[key]) for key in keys)
+
@@ -0,0 +1,313 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+from agents.concurrency import run_blocking
+from agents.metrics import record_llm_call, record_cache_lookup
+from agents.resilience import acall, aguard_stream, call
+
+# Default time-to-live (seconds) per agent; override with LLM_CACHE_TTL_<AGENT>
+DEFAULT_TTL = 3600
+AGENT_TTLS = {
+    "customer_context": 86400,
+    "purchase_pattern": 86400,
+    "product_affinity": 86400,
+    "opportunity_scoring": 3600,
+    "recommendation_report": 3600
+}
+
+
+class MemoryCacheBackend:
+    """
+    In-process LRU cache with per-entry expiry.
+    """
+    blocking = False
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """
+    On-disk LRU cache that survives restarts.
+    """
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_lru ON llm_cache (last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now)
+            )
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+class LLMCache:
+    """
+    Content-addressed cache of LLM responses keyed on model + prompt hash.
+    Tracks hit/miss counters per agent.
+    """
+
+    def __init__(self, backend: Any):
+        self.backend = backend
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def ttl_for(agent: str) -> float:
+        override = os.getenv(f"LLM_CACHE_TTL_{agent.upper()}")
+        if override is not None:
+            return float(override)
+        return AGENT_TTLS.get(agent, DEFAULT_TTL)
+
+    def _record(self, agent: str, hit: bool) -> None:
+        with self._stats_lock:
+            counters = self._stats.setdefault(agent, {"hits": 0, "misses": 0})
+            counters["hits" if hit else "misses"] += 1
+
+    def get(self, agent: str, model: str, prompt: str) -> Optional[str]:
+        value = self.backend.get(self.make_key(model, prompt))
+        self._record(agent, value is not None)
+        return value
+
+    def set(self, agent: str, model: str, prompt: str, value: str) -> None:
+        self.backend.set(self.make_key(model, prompt), value, self.ttl_for(agent))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            per_agent = {agent: dict(counters) for agent, counters in self._stats.items()}
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": sum(c["hits"] for c in per_agent.values()),
+            "misses": sum(c["misses"] for c in per_agent.values()),
+            "agents": per_agent
+        }
+
+
+def _build_cache() -> Optional[LLMCache]:
+    backend = os.getenv("LLM_CACHE_BACKEND", "memory").lower()
+    max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+    if backend == "none":
+        return None
+    if backend == "sqlite":
+        return LLMCache(SQLiteCacheBackend(os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3"), max_entries))
+    return LLMCache(MemoryCacheBackend(max_entries))
+
+
+_cache: Optional[LLMCache] = None
+_cache_initialized = False
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[LLMCache]:
+    """
+    Returns the shared LLM cache configured by $LLM_CACHE_BACKEND (memory, sqlite or none).
+    """
+    global _cache, _cache_initialized
+    if not _cache_initialized:
+        with _cache_lock:
+            if not _cache_initialized:
+                _cache = _build_cache()
+                _cache_initialized = True
+    return _cache
+
+
+def set_cache(cache: Optional[LLMCache]) -> None:
+    """
+    Replaces the shared cache (e.g. with a fresh MemoryCacheBackend in tests).
+    """
+    global _cache, _cache_initialized
+    with _cache_lock:
+        _cache = cache
+        _cache_initialized = True
+
+
+def model_name(llm: Any) -> str:
+    return str(getattr(llm, "model", None) or getattr(llm, "model_name", None) or type(llm).__name__)
+
+
+def _content(response: Any) -> str:
+    # Chat models return a message; plain LLMs (e.g. FakeListLLM) return a string
+    return response if isinstance(response, str) else response.content
+
+
+def _invoke(llm: Any, prompt: str, agent: str) -> str:
+    # Every provider call goes through the resilience layer (timeouts, retries,
+    # hedging, circuit breaker); failures surface as LLMUnavailableError
+    def attempt() -> str:
+        start = time.perf_counter()
+        response = llm.invoke(prompt)
+        text = _content(response)
+        record_llm_call(agent, prompt, response, text, time.perf_counter() - start)
+        return text
+
+    return call(agent, model_name(llm), attempt)
+
+
+async def _ainvoke(llm: Any, prompt: str, agent: str) -> str:
+    async def attempt() -> str:
+        start = time.perf_counter()
+        response = await llm.ainvoke(prompt)
+        text = _content(response)
+        record_llm_call(agent, prompt, response, text, time.perf_counter() - start)
+        return text
+
+    return await acall(agent, model_name(llm), attempt)
+
+
+def cached_invoke(llm: Any, prompt: str, agent: str, accept: Optional[Callable[[str], bool]] = None) -> str:
+    """
+    Invokes the LLM through the shared cache and returns the response text.
+    A response accept rejects (e.g. output that does not parse) is returned but
+    not cached, so the next call asks the model again.
+    """
+    cache = get_cache()
+    if cache is None:
+        return _invoke(llm, prompt, agent)
+    model = model_name(llm)
+    cached = cache.get(agent, model, prompt)
+    record_cache_lookup(agent, cached is not None)
+    if cached is not None:
+        return cached
+    text = _invoke(llm, prompt, agent)
+    if accept is None or accept(text):
+        cache.set(agent, model, prompt, text)
+    return text
+
+
+async def acached_invoke(llm: Any, prompt: str, agent: str, accept: Optional[Callable[[str], bool]] = None) -> str:
+    """
+    Async variant of cached_invoke; blocking cache backends run on the I/O executor.
+    """
+    cache = get_cache()
+    if cache is None:
+        return await _ainvoke(llm, prompt, agent)
+    model = model_name(llm)
+    if cache.backend.blocking:
+        cached = await run_blocking(cache.get, agent, model, prompt)
+    else:
+        cached = cache.get(agent, model, prompt)
+    record_cache_lookup(agent, cached is not None)
+    if cached is not None:
+        return cached
+    text = await _ainvoke(llm, prompt, agent)
+    if accept is not None and not accept(text):
+        return text
+    if cache.backend.blocking:
+        await run_blocking(cache.set, agent, model, prompt, text)
+    else:
+        cache.set(agent, model, prompt, text)
+    return text
+
+
+async def astream_cached(llm: Any, prompt: str, agent: str) -> AsyncIterator[str]:
+    """
+    Streams response text chunks from the LLM as they arrive. A cache hit is
+    yielded as a single chunk; a completed stream is written back to the cache.
+    """
+    cache = get_cache()
+    model = model_name(llm)
+    if cache is not None:
+        if cache.backend.blocking:
+            cached = await run_blocking(cache.get, agent, model, prompt)
+        else:
+            cached = cache.get(agent, model, prompt)
+        record_cache_lookup(agent, cached is not None)
+        if cached is not None:
+            yield cached
+            return
+
+    start = time.perf_counter()
+    chunks = []
+    async for chunk in aguard_stream(agent, model, llm.astream(prompt)):
+        text = _content(chunk)
+        if text:
+            chunks.append(text)
+            yield text
+    text = "".join(chunks)
+    record_llm_call(agent, prompt, None, text, time.perf_counter() - start)
+    if cache is not None:
+        if cache.backend.blocking:
+            await run_blocking(cache.set, agent, model, prompt, text)
+        else:
+            cache.set(agent, model, prompt, text)
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gemini-1.5-flash"
+DEFAULT_TEMPERATURE = 0.7
+
+# Canned responses per agent for the local fake model
+_fake_responses: Dict[str, List[str]] = {}
+# Explicit per-agent models (e.g. fakes injected by tests)
+_overrides: Dict[str, Any] = {}
+_llms: Dict[str, Any] = {}
+_base: Optional[Any] = None
+_lock = threading.Lock()
+
+
+def register_fake_responses(agent: str, responses: List[str]) -> None:
+    """
+    Registers the canned responses an agent gets when the fake model is in use.
+    """
+    _fake_responses[agent] = responses
+
+
+def fake_responses(agent: str) -> List[str]:
+    """
+    Returns the canned responses registered for an agent.
+    """
+    return _fake_responses.get(agent, ["{}"])
+
+
+def set_llm(agent: str, llm: Optional[Any]) -> None:
+    """
+    Pins a specific model for an agent (None removes the pin).
+    """
+    if llm is None:
+        _overrides.pop(agent, None)
+    else:
+        _overrides[agent] = llm
+
+
+def reset() -> None:
+    """
+    Drops every built client so the next get_llm call rebuilds from the environment.
+    """
+    global _base
+    with _lock:
+        _base = None
+        _llms.clear()
+
+
+def provider_name() -> str:
+    """
+    google when $LLM_PROVIDER says so or an API key is configured, otherwise fake.
+    """
+    provider = os.getenv("LLM_PROVIDER")
+    if provider:
+        return provider.lower()
+    return "google" if os.getenv("GOOGLE_API_KEY") else "fake"
+
+
+def _event_loop_running() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def _build_fake(agent: str) -> Any:
+    from langchain_community.llms.fake import FakeStreamingListLLM
+    return FakeStreamingListLLM(responses=fake_responses(agent))
+
+
+def _build_base() -> Any:
+    # One client shared by every agent; its gRPC/REST channel pools connections.
+    # The async client is only created when built inside a running event loop.
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model=os.getenv("LLM_MODEL", DEFAULT_MODEL),
+        google_api_key=os.getenv("GOOGLE_API_KEY"),
+        temperature=float(os.getenv("LLM_TEMPERATURE", DEFAULT_TEMPERATURE)),
+        transport=os.getenv("LLM_TRANSPORT") or None
+    )
+
+
+def _build(agent: str) -> Any:
+    global _base
+    if provider_name() != "google":
+        return _build_fake(agent)
+    try:
+        if _base is None or (_base.async_client is None and _event_loop_running()):
+            _base = _build_base()
+            _llms.clear()
+    except Exception as e:
+        logger.warning("Falling back to the local fake model for %s: %s", agent, str(e))
+        return _build_fake(agent)
+
+    # Per-agent overrides share the base client instead of opening a new one
+    update = {}
+    model = os.getenv(f"LLM_MODEL_{agent.upper()}")
+    if model:
+        update["model"] = model if model.startswith("models/") else f"models/{model}"
+    temperature = os.getenv(f"LLM_TEMPERATURE_{agent.upper()}")
+    if temperature is not None:
+        update["temperature"] = float(temperature)
+    return _base.model_copy(update=update) if update else _base
+
+
+def get_llm(agent: str) -> Any:
+    """
+    Returns the chat model for an agent, building the shared client on first use.
+    Per-agent model/temperature come from $LLM_MODEL_<AGENT> and $LLM_TEMPERATURE_<AGENT>.
+    """
+    override = _overrides.get(agent)
+    if override is not None:
+        return override
+    llm = _llms.get(agent)
+    if llm is not None and not (getattr(llm, "async_client", False) is None and _event_loop_running()):
+        return llm
+    with _lock:
+        load_dotenv()
+        llm = _llms[agent] = _build(agent)
+    return llm
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+import pandas as pd
+from agents.concurrency import run_blocking
+from agents.data_store import get_store
+
+logger = logging.getLogger(__name__)
+
+
+def customer_row_hashes(df: pd.DataFrame) -> Dict[str, str]:
+    """
+    Hashes every row and combines them per Customer ID (order-independent), so a
+    customer's hash changes only when one of its rows changes.
+    """
+    row_hashes = pd.util.hash_pandas_object(df, index=False)
+    grouped = row_hashes.groupby(df["Customer ID"].to_numpy())
+    # uint64 sums wrap around, which is fine for a fingerprint
+    sums, counts = grouped.sum(), grouped.size()
+    return {
+        str(customer_id): f"{int(digest):x}-{int(count)}"
+        for customer_id, digest, count in zip(sums.index, sums.to_numpy(), counts.to_numpy())
+    }
+
+
+class MaterializedStore:
+    """
+    Precomputed pipeline results per customer. refresh() re-hashes the purchase
+    data and recomputes only customers whose rows changed.
+    """
+
+    def __init__(self, compute: Callable[[str], Awaitable[Dict[str, Any]]], concurrency: int = 4):
+        self.compute = compute
+        self.concurrency = concurrency
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._hashes: Dict[str, str] = {}
+        self._computed_at: Dict[str, float] = {}
+        # Data version each result is known to be current for
+        self._versions: Dict[str, Any] = {}
+        # Customers whose last recompute failed; retried by the next refresh
+        self._failed: Set[str] = set()
+        self._data_version = None
+        self._refresh_lock = asyncio.Lock()
+        self.last_refresh: Optional[Dict[str, Any]] = None
+
+    async def get(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the precomputed result with its staleness, or None. data_current
+        is False once the data changed after the result was computed, until a
+        refresh confirms the customer's rows are unchanged.
+        """
+        result = self._results.get(customer_id)
+        if result is None:
+            return None
+        # Reading the version may reload the data, so keep it off the event loop
+        version = await run_blocking(lambda: get_store().version)
+        computed_at = self._computed_at[customer_id]
+        return {
+            **result,
+            "materialized": {
+                "computed_at": computed_at,
+                "age_seconds": round(time.time() - computed_at, 3),
+                "data_current": self._versions.get(customer_id) == version
+            }
+        }
+
+    async def refresh(self, force: bool = False) -> Dict[str, Any]:
+        """
+        Recomputes customers whose purchase rows changed since the last refresh.
+        """
+        async with self._refresh_lock:
+            store = get_store()
+            version = await run_blocking(lambda: store.version)
+            if version == self._data_version and not force and not self._failed:
+                return {"changed": 0, "removed": 0, "failed": 0, "skipped": True}
+
+            start = time.perf_counter()
+            hashes = await run_blocking(lambda: customer_row_hashes(store.frame()))
+            changed = [customer_id for customer_id, digest in hashes.items() if force or self._hashes.get(customer_id) != digest]
+            # Unchanged rows: the existing result is current for this version too
+            for customer_id in self._results:
+                if customer_id in hashes and self._hashes.get(customer_id) == hashes[customer_id]:
+                    self._versions[customer_id] = version
+            removed = [customer_id for customer_id in self._results if customer_id not in hashes]
+            for customer_id in removed:
+                self._results.pop(customer_id, None)
+                self._hashes.pop(customer_id, None)
+                self._computed_at.pop(customer_id, None)
+                self._versions.pop(customer_id, None)
+            self._failed.intersection_update(hashes)
+
+            semaphore = asyncio.Semaphore(max(1, self.concurrency))
+            failed = 0
+
+            async def recompute(customer_id: str) -> None:
+                nonlocal failed
+                async with semaphore:
+                    result = await self.compute(customer_id)
+                if "error" in result:
+                    # Leave the hash unset so the next refresh retries this customer; a
+                    # previous result is kept but no longer reported as current
+                    failed += 1
+                    self._hashes.pop(customer_id, None)
+                    self._failed.add(customer_id)
+                    return
+                self._failed.discard(customer_id)
+                self._results[customer_id] = result
+                self._hashes[customer_id] = hashes[customer_id]
+                self._computed_at[customer_id] = time.time()
+                self._versions[customer_id] = version
+
+            await asyncio.gather(*[recompute(customer_id) for customer_id in changed])
+            self._data_version = version
+            self.last_refresh = {
+                "changed": len(changed),
+                "removed": len(removed),
+                "failed": failed,
+                "elapsed_seconds": round(time.perf_counter() - start, 3),
+                "finished_at": time.time()
+            }
+            logger.info("Materialized results refreshed: %s", self.last_refresh)
+            return self.last_refresh
+
+    async def run_forever(self, interval: float) -> None:
+        """
+        Background refresher: checks for data changes every interval seconds.
+        """
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("Materialized refresh failed: %s", str(e))
+            await asyncio.sleep(interval)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "customers": len(self._results),
+            "data_version": self._data_version,
+            "last_refresh": self.last_refresh
+        }
@@ -0,0 +1,195 @@
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+# Set METRICS_ENABLED=false for a no-op mode: every recording call returns immediately
+ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram with optional labels.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        if not ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            # One slot per bucket, then +Inf, sum and count
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0.0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labelvalues, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets + (float("inf"),), series):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    labels = _format_labels(self.labelnames, labelvalues, f'le="{le}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, labelvalues)
+                lines.append(f"{self.name}_sum{labels} {series[-2]}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def register(self, metric: Any) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+NODE_LATENCY = REGISTRY.register(Histogram(
+    "crosssell_node_latency_seconds", "Latency of each LangGraph node", ("node",)
+))
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "crosssell_pipeline_latency_seconds", "End-to-end pipeline latency per customer", ("mode",)
+))
+LLM_LATENCY = REGISTRY.register(Histogram(
+    "crosssell_llm_latency_seconds", "Latency of LLM calls that missed the cache", ("agent",)
+))
+LLM_CALLS = REGISTRY.register(Counter(
+    "crosssell_llm_calls_total", "LLM calls sent to the provider", ("agent",)
+))
+LLM_PROMPT_CHARS = REGISTRY.register(Counter(
+    "crosssell_llm_prompt_chars_total", "Characters sent to the LLM", ("agent",)
+))
+LLM_RESPONSE_CHARS = REGISTRY.register(Counter(
+    "crosssell_llm_response_chars_total", "Characters received from the LLM", ("agent",)
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "crosssell_llm_tokens_total", "Tokens reported by the LLM provider", ("agent", "kind")
+))
+LLM_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "crosssell_llm_cache_lookups_total", "LLM cache lookups", ("agent", "result")
+))
+COALESCED_REQUESTS = REGISTRY.register(Counter(
+    "crosssell_coalesced_requests_total", "Recommendation requests by how they were served", ("result",)
+))
+FALLBACKS = REGISTRY.register(Counter(
+    "crosssell_fallbacks_total", "Times an agent fell back to its static result instead of the LLM output", ("agent",)
+))
+LLM_PARSES = REGISTRY.register(Counter(
+    "crosssell_llm_parse_total", "Structured-output parses by result (ok, repaired, invalid, unparseable)", ("agent", "result")
+))
+RESILIENCE_EVENTS = REGISTRY.register(Counter(
+    "crosssell_llm_resilience_events_total", "LLM timeouts, retries, hedges and circuit-breaker events", ("agent", "event")
+))
+
+
+def record_llm_call(agent: str, prompt: str, response: Any, text: str, elapsed: float) -> None:
+    if not ENABLED:
+        return
+    LLM_CALLS.inc(agent)
+    LLM_LATENCY.observe(elapsed, agent)
+    LLM_PROMPT_CHARS.inc(agent, amount=len(prompt))
+    LLM_RESPONSE_CHARS.inc(agent, amount=len(text))
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        LLM_TOKENS.inc(agent, "input", amount=usage.get("input_tokens", 0))
+        LLM_TOKENS.inc(agent, "output", amount=usage.get("output_tokens", 0))
+
+
+def record_cache_lookup(agent: str, hit: bool) -> None:
+    LLM_CACHE_LOOKUPS.inc(agent, "hit" if hit else "miss")
+
+
+def record_fallback(agent: str) -> None:
+    FALLBACKS.inc(agent)
+
+
+def record_parse(agent: str, result: str) -> None:
+    LLM_PARSES.inc(agent, result)
+
+
+def record_resilience_event(agent: str, event: str) -> None:
+    RESILIENCE_EVENTS.inc(agent, event)
+
+
+def instrument_node(name: str, node: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]) -> Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]:
+    """
+    Wraps an async graph node to record its latency. When metrics are enabled the
+    node's elapsed milliseconds are also returned under the "timings" state key.
+    """
+    if not ENABLED:
+        return node
+
+    @functools.wraps(node)
+    async def wrapper(state: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            update = await node(state)
+        finally:
+            elapsed = time.perf_counter() - start
+            NODE_LATENCY.observe(elapsed, name)
+        return {**update, "timings": {name: round(elapsed * 1000, 3)}}
+
+    return wrapper
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -1,24 +1,18 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from langchain.prompts import PromptTemplate
-from dotenv import load_dotenv
-try:
-    from langchain_google_genai import ChatGoogleGenerativeAI
-except ImportError:
-    from langchain_community.llms import FakeListLLM
-import os
+from agents.llm_provider import get_llm, register_fake_responses
+from agents.llm_cache import cached_invoke, acached_invoke
+from agents.pipeline_mode import uses_llm
+from agents.metrics import record_fallback
+from agents.llm_batching import estimate_tokens, plan_batches, format_batch
+from agents.structured_output import ScoredOpportunities, parse_output, parse_keyed_output, validate_output, conforms, conforms_keyed
+from agents.customer_features import get_customer_features
+from agents.concurrency import run_blocking
+import asyncio
 import json
 
-load_dotenv()
-
-# Initialize Gemini model
-# try:
-llm = ChatGoogleGenerativeAI(
-        model="gemini-1.5-flash",
-        google_api_key=os.getenv("GOOGLE_API_KEY"),
-        temperature=0.7
-    )
-# except Exception:
-#     llm = FakeListLLM(responses=['[{"product": "Collaboration Suite", "score": 0.8, "rationale": "Cross-sell opportunity based on industry patterns"}, {"product": "API Integrations", "score": 0.8, "rationale": "Cross-sell opportunity based on industry patterns"}, {"product": "Advanced Analytics", "score": 0.8, "rationale": "Cross-sell opportunity based on industry patterns"}, {"product": "Backup Batteries", "score": 0.6, "rationale": "Upsell opportunity based on product affinity"}, {"product": "Power Cords", "score": 0.6, "rationale": "Upsell opportunity based on product affinity"}, {"product": "Drills", "score": 0.6, "rationale": "Upsell opportunity based on product affinity"}, {"product": "Safety Gear", "score": 0.6, "rationale": "Upsell opportunity based on product affinity"}]'] * 10)
+# Canned response for the local fake model (see agents.llm_provider)
+register_fake_responses("opportunity_scoring", ['[{"product": "Collaboration Suite", "score": 0.8, "rationale": "Cross-sell opportunity based on industry patterns"}, {"product": "API Integrations", "score": 0.8, "rationale": "Cross-sell opportunity based on industry patterns"}, {"product": "Advanced Analytics", "score": 0.8, "rationale": "Cross-sell opportunity based on industry patterns"}, {"product": "Backup Batteries", "score": 0.6, "rationale": "Upsell opportunity based on product affinity"}, {"product": "Power Cords", "score": 0.6, "rationale": "Upsell opportunity based on product affinity"}, {"product": "Drills", "score": 0.6, "rationale": "Upsell opportunity based on product affinity"}, {"product": "Safety Gear", "score": 0.6, "rationale": "Upsell opportunity based on product affinity"}]'])
 
 # Prompt for opportunity scoring
 scoring_prompt = PromptTemplate(
@@ -31,17 +25,56 @@ Purchased products: {purchased_products}
 
 Return output strictly in JSON array format like:
 [
-  {"product": "product_name", "score": float (0.0 - 1.0), "rationale": "reason for score"},
+  {{"product": "product_name", "score": float (0.0 - 1.0), "rationale": "reason for score"}},
   ...
 ]
 Only return the JSON array. Do not include any explanations or additional text.
 """
 )
 
-def score_opportunities(missing_products: List[str], affinity_products: List[str], purchased_products: List[str] = None) -> List[Dict[str, Any]]:
+# Prompt for scoring several customers in one call (see score_opportunities_batch)
+batch_scoring_prompt = PromptTemplate(
+    input_variables=["customers"],
+    template="""
+Score cross-sell and upsell opportunities for each customer below.
+Each line is a customer ID followed by that customer's missing, affinity and purchased products.
+{customers}
+
+Return output strictly as a JSON object keyed by customer ID, like:
+{{
+  "customer_id": [
+    {{"product": "product_name", "score": float (0.0 - 1.0), "rationale": "reason for score"}},
+    ...
+  ],
+  ...
+}}
+Include every customer ID. Only return the JSON object. Do not include any explanations or additional text.
+"""
+)
+
+# Expected response tokens per scored product, used to size batches
+SCORE_OUTPUT_TOKENS = 30
+
+def _static_scores(customer_id: Optional[str], missing_products: List[str], affinity_products: List[str], purchased_products: List[str]) -> List[Dict[str, Any]]:
+    # Fallback static scoring from the customer's feature vector (see agents.customer_features)
+    return get_customer_features().score([customer_id], [missing_products], [affinity_products], [purchased_products])[0]
+
+def _valid_scores(parsed: Optional[ScoredOpportunities], fallback: List[Dict[str, Any]], purchased_products: List[str]) -> List[Dict[str, Any]]:
+    if parsed is None:
+        record_fallback("opportunity_scoring")
+        return fallback
+    # Filter out purchased products from LLM response
+    return [item.model_dump() for item in parsed.root if item.product not in purchased_products]
+
+def _parse_scores(result: str, fallback: List[Dict[str, Any]], purchased_products: List[str]) -> List[Dict[str, Any]]:
+    return _valid_scores(parse_output(result, ScoredOpportunities, "opportunity_scoring"), fallback, purchased_products)
+
+def score_opportunities(missing_products: List[str], affinity_products: List[str], purchased_products: List[str] = None, mode: Optional[str] = None, customer_id: Optional[str] = None) -> List[Dict[str, Any]]:
     """
-    Scores cross-sell and upsell opportunities with rationale.
+    Scores cross-sell and upsell opportunities with rationale. customer_id selects
+    the feature vector behind the static scores; unknown customers score neutrally.
     """
+    fallback = []
     try:
         if purchased_products is None:
             purchased_products = []
@@ -49,30 +82,135 @@ def score_opportunities(missing_products: List[str], affinity_products: List[str
         if not opportunities:
             return []
 
-        # Fallback static scoring
-        fallback = []
-        for product in opportunities:
-            score = 0.8 if product in missing_products else 0.6
-            rationale = f"{'Cross-sell' if product in missing_products else 'Upsell'} opportunity based on {'industry patterns' if product in missing_products else 'product affinity'}"
-            fallback.append({"product": product, "score": score, "rationale": rationale})
+        fallback = _static_scores(customer_id, missing_products, affinity_products, purchased_products)
+        if not uses_llm("opportunity_scoring", mode):
+            return fallback
 
         # Gemini-generated scoring
-        result = llm.invoke(
+        result = cached_invoke(
+            get_llm("opportunity_scoring"),
             scoring_prompt.format(
                 missing_products=str(missing_products),
                 affinity_products=str(affinity_products),
                 purchased_products=str(purchased_products)
-            )
-        ).content.strip()
+            ),
+            agent="opportunity_scoring",
+            accept=lambda text: conforms(text, ScoredOpportunities)
+        ).strip()
+        return _parse_scores(result, fallback, purchased_products)
 
-        try:
-            parsed = json.loads(result)
-            if isinstance(parsed, list) and all(isinstance(item, dict) and "product" in item and "score" in item and "rationale" in item for item in parsed):
-                # Filter out purchased products from LLM response
-                return [item for item in parsed if item["product"] not in purchased_products]
-            return fallback
-        except json.JSONDecodeError:
+    except Exception:
+        record_fallback("opportunity_scoring")
+        return fallback
+
+async def ascore_opportunities(missing_products: List[str], affinity_products: List[str], purchased_products: List[str] = None, mode: Optional[str] = None, customer_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Async variant of score_opportunities.
+    """
+    fallback = []
+    try:
+        if purchased_products is None:
+            purchased_products = []
+        opportunities = list(set(missing_products + affinity_products) - set(purchased_products))  # Exclude purchased products
+        if not opportunities:
+            return []
+
+        fallback = await run_blocking(_static_scores, customer_id, missing_products, affinity_products, purchased_products)
+        if not uses_llm("opportunity_scoring", mode):
             return fallback
 
+        result = (await acached_invoke(
+            get_llm("opportunity_scoring"),
+            scoring_prompt.format(
+                missing_products=str(missing_products),
+                affinity_products=str(affinity_products),
+                purchased_products=str(purchased_products)
+            ),
+            agent="opportunity_scoring",
+            accept=lambda text: conforms(text, ScoredOpportunities)
+        )).strip()
+        return _parse_scores(result, fallback, purchased_products)
+
     except Exception:
-        return fallback
\ No newline at end of file
+        record_fallback("opportunity_scoring")
+        return fallback
+
+def _plan_scoring(customers: Dict[str, Dict[str, List[str]]]):
+    """
+    Computes every customer's static scores in one vectorized pass and packs the
+    customers that still have candidates into batches that fit the token limits.
+    """
+    customer_ids = list(customers)
+    missing = [customers[customer_id].get("missing_products", []) for customer_id in customer_ids]
+    affinity = [customers[customer_id].get("affinity_products", []) for customer_id in customer_ids]
+    purchased = [customers[customer_id].get("purchased_products") or [] for customer_id in customer_ids]
+    static = get_customer_features().score(customer_ids, missing, affinity, purchased) if customer_ids else []
+    fallbacks: Dict[str, List[Dict[str, Any]]] = dict(zip(customer_ids, static))
+    payloads: Dict[str, str] = {}
+    output_tokens: Dict[str, int] = {}
+    for customer_id, missing_products, affinity_products, purchased_products in zip(customer_ids, missing, affinity, purchased):
+        opportunities = fallbacks[customer_id]
+        if opportunities:
+            payloads[customer_id] = json.dumps({
+                "missing_products": missing_products,
+                "affinity_products": affinity_products,
+                "purchased_products": purchased_products
+            })
+            output_tokens[customer_id] = SCORE_OUTPUT_TOKENS * len(opportunities) + 10
+    overhead = estimate_tokens(batch_scoring_prompt.format(customers=""))
+    return fallbacks, payloads, plan_batches(payloads, overhead, output_tokens)
+
+def _apply_batch(results: Dict[str, List[Dict[str, Any]]], customers: Dict[str, Dict[str, List[str]]], batch: List[str], response: str) -> None:
+    # Each customer is validated on its own, so one bad item only costs that customer its LLM scores
+    parsed, repaired = parse_keyed_output(response, "opportunity_scoring")
+    for customer_id in batch:
+        purchased_products = customers[customer_id].get("purchased_products") or []
+        scores = validate_output(parsed.get(customer_id), ScoredOpportunities, "opportunity_scoring", repaired) if parsed else None
+        results[customer_id] = _valid_scores(scores, results[customer_id], purchased_products)
+
+def score_opportunities_batch(customers: Dict[str, Dict[str, List[str]]], mode: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Scores opportunities for many customers, packing several customers into each
+    Gemini prompt. customers maps customer ID to its missing_products,
+    affinity_products and purchased_products. A customer whose item is missing or
+    malformed in the response gets its static scores.
+    """
+    results, payloads, batches = _plan_scoring(customers)
+    if not uses_llm("opportunity_scoring", mode):
+        return results
+    for batch in batches:
+        try:
+            response = cached_invoke(
+                get_llm("opportunity_scoring"),
+                batch_scoring_prompt.format(customers=format_batch(payloads, batch)),
+                agent="opportunity_scoring",
+                accept=lambda text: conforms_keyed(text, ScoredOpportunities, batch)
+            )
+        except Exception:
+            response = ""
+        _apply_batch(results, customers, batch, response)
+    return results
+
+async def ascore_opportunities_batch(customers: Dict[str, Dict[str, List[str]]], mode: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Async variant of score_opportunities_batch; the batches are sent concurrently.
+    """
+    results, payloads, batches = await run_blocking(_plan_scoring, customers)
+    if not uses_llm("opportunity_scoring", mode):
+        return results
+
+    async def send(batch: List[str]) -> str:
+        try:
+            return await acached_invoke(
+                get_llm("opportunity_scoring"),
+                batch_scoring_prompt.format(customers=format_batch(payloads, batch)),
+                agent="opportunity_scoring",
+                accept=lambda text: conforms_keyed(text, ScoredOpportunities, batch)
+            )
+        except Exception:
+            return ""
+
+    responses = await asyncio.gather(*[send(batch) for batch in batches])
+    for batch, response in zip(batches, responses):
+        _apply_batch(results, customers, batch, response)
+    return results
@@ -0,0 +1,28 @@
+import os
+from typing import Optional
+
+# fast: rule-based results only, no LLM calls
+# hybrid: rule-based structured results, LLM only for the narrative report
+# llm: every agent calls the LLM (static results remain the fallback)
+MODES = ("fast", "hybrid", "llm")
+HYBRID_LLM_AGENTS = {"recommendation_report"}
+
+
+def resolve_mode(mode: Optional[str] = None) -> str:
+    """
+    Returns the requested mode, or the deployment default from $PIPELINE_MODE.
+    """
+    if mode is None:
+        mode = os.getenv("PIPELINE_MODE", "llm")
+    mode = mode.lower()
+    if mode not in MODES:
+        raise ValueError(f"Unknown pipeline mode {mode}; expected one of {MODES}")
+    return mode
+
+
+def uses_llm(agent: str, mode: Optional[str] = None) -> bool:
+    """
+    Whether an agent should call the LLM under the given mode.
+    """
+    mode = resolve_mode(mode)
+    return mode == "llm" or (mode == "hybrid" and agent in HYBRID_LLM_AGENTS)
@@ -1,24 +1,20 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from langchain.prompts import PromptTemplate
-from dotenv import load_dotenv
-try:
-    from langchain_google_genai import ChatGoogleGenerativeAI
-except ImportError:
-    from langchain_community.llms import FakeListLLM
+from agents.llm_provider import get_llm, register_fake_responses
+from agents.llm_cache import cached_invoke, acached_invoke
+from agents.pipeline_mode import uses_llm
+from agents.metrics import record_fallback
+from agents.resilience import LLMUnavailableError
+from agents.affinity_engine import get_affinity_model
+from agents.concurrency import run_blocking
+from agents.llm_batching import estimate_tokens, plan_batches, format_batch
+from agents.structured_output import AffinityList, parse_output, parse_keyed_output, validate_output, conforms, conforms_keyed
+import asyncio
 import os
 import json
 
-load_dotenv()
-
-# Initialize Gemini model
-try:
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-1.5-flash",
-        google_api_key=os.getenv("GOOGLE_API_KEY"),
-        temperature=0.7
-    )
-except Exception:
-    llm = FakeListLLM(responses=['["Backup Batteries", "Power Cords", "API Integrations", "Advanced Analytics"]'] * 10)
+# Canned response for the local fake model (see agents.llm_provider)
+register_fake_responses("product_affinity", ['["Backup Batteries", "Power Cords", "API Integrations", "Advanced Analytics"]'])
 
 # Prompt for related products
 affinity_prompt = PromptTemplate(
@@ -31,45 +27,182 @@ Only return the JSON array.
 """
 )
 
-def suggest_related_products(frequent_products: List[str]) -> List[str]:
+# Prompt for suggesting products for several customers in one call (see suggest_related_products_batch)
+batch_affinity_prompt = PromptTemplate(
+    input_variables=["customers"],
+    template="""
+For each customer below, suggest related or co-purchased products based on general product purchasing behavior.
+Each line is a customer ID followed by that customer's frequently purchased products.
+{customers}
+
+Return the result strictly as a JSON object keyed by customer ID, like:
+{{"customer_id": ["related_product1", "related_product2"], ...}}
+Include every customer ID. Only return the JSON object.
+"""
+)
+
+# Expected response tokens per customer, used to size batches
+SUGGESTION_OUTPUT_TOKENS = 60
+
+# Seed affinities for products with no co-purchase history in the data yet
+affinity_map = {
+    "Generators": ["Backup Batteries", "Power Cords"],
+    "Drills": ["Drill Bits", "Protective Gloves"],
+    "Advanced Analytics": ["API Integrations", "Workflow Automation"],
+    "Collaboration Suite": ["Advanced Analytics", "Workflow Automation"],
+    "Workflow Automation": ["AI Insights Module", "API Integrations"],
+    "Drill Bits": ["Drills", "Protective Gloves"],
+    "Protective Gloves": ["Safety Gear", "Drills"]
+}
+
+def _llm_enrichment_enabled() -> bool:
+    return os.getenv("AFFINITY_LLM_ENRICHMENT", "true").lower() in ("1", "true", "yes")
+
+def _static_suggestions(frequent_products: List[str]) -> List[str]:
+    """
+    Data-driven co-purchase suggestions, topped up from the seed map for unseen products.
+    """
+    model = get_affinity_model()
+    static_suggestions = model.suggest(frequent_products, k=int(os.getenv("AFFINITY_TOP_K", "5")))
+    for product in frequent_products:
+        if not model.related(product):
+            static_suggestions.extend(affinity_map.get(product, []))
+    return list(dict.fromkeys(static_suggestions))
+
+def _combine_suggestions(static_suggestions: List[str], dynamic_suggestions: Optional[AffinityList]) -> List[str]:
+    if dynamic_suggestions is None:
+        record_fallback("product_affinity")
+        return static_suggestions
+
+    # Combine static + Gemini, remove duplicates while keeping affinity order
+    return list(dict.fromkeys(static_suggestions + dynamic_suggestions.root))
+
+def _merge_suggestions(static_suggestions: List[str], gemini_response: str) -> List[str]:
+    return _combine_suggestions(static_suggestions, parse_output(gemini_response, AffinityList, "product_affinity"))
+
+def suggest_related_products(frequent_products: List[str], mode: Optional[str] = None) -> List[str]:
     """
     Suggests related/co-purchased products based on a list of frequent products.
-    Combines static affinity map with Gemini-generated suggestions.
+    Uses the co-purchase affinity model, optionally enriched with Gemini suggestions
+    (AFFINITY_LLM_ENRICHMENT) in llm mode.
     """
     try:
         if not frequent_products:
             return []
 
-        # Static rule-based affinities for robustness
-        affinity_map = {
-            "Generators": ["Backup Batteries", "Power Cords"],
-            "Drills": ["Drill Bits", "Protective Gloves"],
-            "Advanced Analytics": ["API Integrations", "Workflow Automation"],
-            "Collaboration Suite": ["Advanced Analytics", "Workflow Automation"],
-            "Workflow Automation": ["AI Insights Module", "API Integrations"],
-            "Drill Bits": ["Drills", "Protective Gloves"],
-            "Protective Gloves": ["Safety Gear", "Drills"]
-        }
-
-        static_suggestions = []
-        for product in frequent_products:
-            static_suggestions.extend(affinity_map.get(product, []))
+        static_suggestions = _static_suggestions(frequent_products)
+        if not uses_llm("product_affinity", mode) or not _llm_enrichment_enabled():
+            return static_suggestions
 
         # Gemini-generated suggestions
-        gemini_response = llm.invoke(
-            affinity_prompt.format(products=str(frequent_products))
-        ).content.strip()
-
-        dynamic_suggestions = []
         try:
-            dynamic_suggestions = json.loads(gemini_response)
-            if not isinstance(dynamic_suggestions, list):
-                dynamic_suggestions = []
-        except json.JSONDecodeError:
-            dynamic_suggestions = []
+            gemini_response = cached_invoke(
+                get_llm("product_affinity"),
+                affinity_prompt.format(products=str(frequent_products)),
+                agent="product_affinity",
+                accept=lambda text: conforms(text, AffinityList)
+            ).strip()
+        except LLMUnavailableError:
+            record_fallback("product_affinity")
+            return static_suggestions
+        return _merge_suggestions(static_suggestions, gemini_response)
+
+    except Exception as e:
+        return []
+
+async def asuggest_related_products(frequent_products: List[str], mode: Optional[str] = None) -> List[str]:
+    """
+    Async variant of suggest_related_products; the affinity model is built on the
+    blocking I/O executor.
+    """
+    try:
+        if not frequent_products:
+            return []
+
+        static_suggestions = await run_blocking(_static_suggestions, frequent_products)
+        if not uses_llm("product_affinity", mode) or not _llm_enrichment_enabled():
+            return static_suggestions
 
-        # Combine static + Gemini, remove duplicates
-        return list(set(static_suggestions + dynamic_suggestions))
+        try:
+            gemini_response = (await acached_invoke(
+                get_llm("product_affinity"),
+                affinity_prompt.format(products=str(frequent_products)),
+                agent="product_affinity",
+                accept=lambda text: conforms(text, AffinityList)
+            )).strip()
+        except LLMUnavailableError:
+            record_fallback("product_affinity")
+            return static_suggestions
+        return _merge_suggestions(static_suggestions, gemini_response)
 
     except Exception as e:
-        return []
\ No newline at end of file
+        return []
+
+def _plan_suggestions(frequent_products: Dict[str, List[str]]):
+    """
+    Computes each customer's static suggestions and packs the customers with
+    frequent products into batches that fit the token limits.
+    """
+    static = {customer_id: _static_suggestions(products) if products else [] for customer_id, products in frequent_products.items()}
+    payloads = {customer_id: json.dumps(products) for customer_id, products in frequent_products.items() if products}
+    output_tokens = {customer_id: SUGGESTION_OUTPUT_TOKENS for customer_id in payloads}
+    overhead = estimate_tokens(batch_affinity_prompt.format(customers=""))
+    return static, payloads, plan_batches(payloads, overhead, output_tokens)
+
+def _apply_batch(results: Dict[str, List[str]], batch: List[str], response: str) -> None:
+    # A customer missing from the response keeps its static suggestions only
+    parsed, repaired = parse_keyed_output(response, "product_affinity")
+    for customer_id in batch:
+        suggestions = validate_output(parsed.get(customer_id), AffinityList, "product_affinity", repaired) if parsed else None
+        results[customer_id] = _combine_suggestions(results[customer_id], suggestions)
+
+def suggest_related_products_batch(frequent_products: Dict[str, List[str]], mode: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    Suggests related products for many customers (customer ID -> frequent products),
+    packing several customers into each Gemini enrichment prompt.
+    """
+    try:
+        results, payloads, batches = _plan_suggestions(frequent_products)
+    except Exception:
+        return {customer_id: [] for customer_id in frequent_products}
+    if not uses_llm("product_affinity", mode) or not _llm_enrichment_enabled():
+        return results
+    for batch in batches:
+        try:
+            response = cached_invoke(
+                get_llm("product_affinity"),
+                batch_affinity_prompt.format(customers=format_batch(payloads, batch)),
+                agent="product_affinity",
+                accept=lambda text: conforms_keyed(text, AffinityList, batch)
+            )
+        except Exception:
+            response = ""
+        _apply_batch(results, batch, response)
+    return results
+
+async def asuggest_related_products_batch(frequent_products: Dict[str, List[str]], mode: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    Async variant of suggest_related_products_batch; the batches are sent concurrently.
+    """
+    try:
+        results, payloads, batches = await run_blocking(_plan_suggestions, frequent_products)
+    except Exception:
+        return {customer_id: [] for customer_id in frequent_products}
+    if not uses_llm("product_affinity", mode) or not _llm_enrichment_enabled():
+        return results
+
+    async def send(batch: List[str]) -> str:
+        try:
+            return await acached_invoke(
+                get_llm("product_affinity"),
+                batch_affinity_prompt.format(customers=format_batch(payloads, batch)),
+                agent="product_affinity",
+                accept=lambda text: conforms_keyed(text, AffinityList, batch)
+            )
+        except Exception:
+            return ""
+
+    responses = await asyncio.gather(*[send(batch) for batch in batches])
+    for batch, response in zip(batches, responses):
+        _apply_batch(results, batch, response)
+    return results
@@ -1,27 +1,16 @@
-import pandas as pd
-import os
-import json
-from typing import Dict, Any
-from dotenv import load_dotenv
-try:
-    from langchain_google_genai import ChatGoogleGenerativeAI
-except ImportError:
-    from langchain_community.llms import FakeListLLM
+from typing import Dict, Any, Optional
+from agents.llm_provider import get_llm, register_fake_responses
+from agents.llm_cache import cached_invoke, acached_invoke
+from agents.pipeline_mode import uses_llm
+from agents.metrics import record_fallback
+from agents.resilience import LLMUnavailableError
+from agents.structured_output import PurchasePatterns, parse_output, conforms
 from langchain.prompts import PromptTemplate
+from agents.data_store import get_store
+from agents.concurrency import run_blocking
 
-load_dotenv()
-
-# Initialize LLM
-try:
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-1.5-flash",
-        google_api_key=os.getenv("GOOGLE_API_KEY"),
-        temperature=0.7
-    )
-except Exception:
-    llm = FakeListLLM(responses=['{"frequent_products": ["Drill Bits", "Protective Gloves", "Generators", "Workflow Automation"], "missing_products": ["Collaboration Suite", "API Integrations"]}'] * 10)
-
-DATA_FILE = os.getenv("DATA_FILE", "data/customer_data_purchases.csv")
+# Canned response for the local fake model (see agents.llm_provider)
+register_fake_responses("purchase_pattern", ['{"frequent_products": ["Drill Bits", "Protective Gloves", "Generators", "Workflow Automation"], "missing_products": ["Collaboration Suite", "API Integrations"]}'])
 
 pattern_prompt = PromptTemplate(
     input_variables=["products", "industry"],
@@ -36,49 +25,97 @@ Only return the JSON.
 """
 )
 
-def analyze_purchase_patterns(customer_id: str) -> Dict[str, Any]:
+def _static_patterns(customer_id: str) -> Dict[str, Any]:
     """
-    Analyzes purchase patterns to identify frequent and missing products.
+    Looks up the customer's purchases and computes the static industry-pattern fallback.
     """
-    try:
-        if not os.path.exists(DATA_FILE):
-            return {"error": f"CSV file {DATA_FILE} not found"}
-        df = pd.read_csv(DATA_FILE)
-        cust = df[df["Customer ID"] == customer_id]
-        if cust.empty:
-            return {"error": f"Customer ID {customer_id} not found"}
+    store = get_store()
+    if not store.exists():
+        return {"error": f"Data file {store.data_file} not found"}
+    cust = store.customer_rows(customer_id, columns=["Product", "Industry"])
+    if cust is None or cust.empty:
+        return {"error": f"Customer ID {customer_id} not found"}
 
-        products = cust["Product"].tolist()
-        industry = cust.iloc[0]["Industry"]
+    products = cust["Product"].tolist()
+    industry = cust.iloc[0]["Industry"]
 
-        # Fallback static analysis
-        industry_patterns = {
-            "Electronics": ["Collaboration Suite", "API Integrations", "Advanced Analytics"],
-            "Apparel": ["Advanced Analytics", "Workflow Automation"],
-            "Hospitality": ["API Integrations", "Workflow Automation"],
-            "Construction": ["Backup Batteries", "Safety Gear", "Heavy Equipment"],
-            "Energy": ["AI Insights Module", "Collaboration Suite"]
+    # Fallback static analysis
+    industry_patterns = {
+        "Electronics": ["Collaboration Suite", "API Integrations", "Advanced Analytics"],
+        "Apparel": ["Advanced Analytics", "Workflow Automation"],
+        "Hospitality": ["API Integrations", "Workflow Automation"],
+        "Construction": ["Backup Batteries", "Safety Gear", "Heavy Equipment"],
+        "Energy": ["AI Insights Module", "Collaboration Suite"]
+    }
+    frequent_products = list(set(products))
+    missing_products = [p for p in industry_patterns.get(industry, []) if p not in products]
+    return {
+        "products": products,
+        "industry": industry,
+        "fallback": {
+            "frequent_products": frequent_products,
+            "missing_products": missing_products
         }
-        frequent_products = list(set(products))
-        missing_products = [p for p in industry_patterns.get(industry, []) if p not in products]
+    }
 
-        # Try Gemini analysis
-        analysis = llm.invoke(
-            pattern_prompt.format(products=str(products), industry=industry)
-        ).content.strip()
+def _parse_patterns(analysis: str, fallback: Dict[str, Any]) -> Dict[str, Any]:
+    parsed = parse_output(analysis, PurchasePatterns, "purchase_pattern")
+    if parsed is not None:
+        return parsed.model_dump()
+
+    # Return fallback
+    record_fallback("purchase_pattern")
+    return fallback
+
+def analyze_purchase_patterns(customer_id: str, mode: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Analyzes purchase patterns to identify frequent and missing products.
+    """
+    try:
+        static = _static_patterns(customer_id)
+        if "error" in static:
+            return static
+        if not uses_llm("purchase_pattern", mode):
+            return static["fallback"]
 
+        # Try Gemini analysis
         try:
-            result = json.loads(analysis)
-            if isinstance(result, dict) and "frequent_products" in result and "missing_products" in result:
-                return result
-        except json.JSONDecodeError:
-            pass
+            analysis = cached_invoke(
+                get_llm("purchase_pattern"),
+                pattern_prompt.format(products=str(static["products"]), industry=static["industry"]),
+                agent="purchase_pattern",
+                accept=lambda text: conforms(text, PurchasePatterns)
+            ).strip()
+        except LLMUnavailableError:
+            record_fallback("purchase_pattern")
+            return static["fallback"]
+        return _parse_patterns(analysis, static["fallback"])
 
-        # Return fallback
-        return {
-            "frequent_products": frequent_products,
-            "missing_products": missing_products
-        }
+    except Exception as e:
+        return {"error": f"Failed to analyze patterns: {str(e)}"}
+
+async def aanalyze_purchase_patterns(customer_id: str, mode: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Async variant of analyze_purchase_patterns; store access runs on the blocking I/O executor.
+    """
+    try:
+        static = await run_blocking(_static_patterns, customer_id)
+        if "error" in static:
+            return static
+        if not uses_llm("purchase_pattern", mode):
+            return static["fallback"]
+
+        try:
+            analysis = (await acached_invoke(
+                get_llm("purchase_pattern"),
+                pattern_prompt.format(products=str(static["products"]), industry=static["industry"]),
+                agent="purchase_pattern",
+                accept=lambda text: conforms(text, PurchasePatterns)
+            )).strip()
+        except LLMUnavailableError:
+            record_fallback("purchase_pattern")
+            return static["fallback"]
+        return _parse_patterns(analysis, static["fallback"])
 
     except Exception as e:
-        return {"error": f"Failed to analyze patterns: {str(e)}"}
\ No newline at end of file
+        return {"error": f"Failed to analyze patterns: {str(e)}"}
@@ -1,23 +1,13 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, AsyncIterator
 from langchain.prompts import PromptTemplate
-from dotenv import load_dotenv
-try:
-    from langchain_google_genai import ChatGoogleGenerativeAI
-except ImportError:
-    from langchain_community.llms import FakeListLLM
-import os
-
-load_dotenv()
-
-# Initialize LLM
-try:
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-1.5-flash",
-        google_api_key=os.getenv("GOOGLE_API_KEY"),
-        temperature=0.7
-    )
-except Exception:
-    llm = FakeListLLM(responses=["""# Research Report: Cross-Sell and Upsell Opportunities for C001
+from agents.llm_provider import get_llm, register_fake_responses
+from agents.llm_cache import cached_invoke, acached_invoke, astream_cached
+from agents.pipeline_mode import uses_llm
+from agents.metrics import record_fallback
+from agents.resilience import LLMUnavailableError
+
+# Canned response for the local fake model (see agents.llm_provider)
+register_fake_responses("recommendation_report", ["""# Research Report: Cross-Sell and Upsell Opportunities for C001
 ## Introduction
 This report analyzes recent purchasing behavior and benchmarks against industry peers.
 
@@ -40,14 +30,10 @@ This report analyzes recent purchasing behavior and benchmarks against industry
 7. Safety Gear (Upsell opportunity based on product affinity)
 
 ## Conclusion
-Targeted campaigns focusing on these products can increase revenue and customer satisfaction."""] * 10)
+Targeted campaigns focusing on these products can increase revenue and customer satisfaction."""])
 
-# Prompt for research report
-report_prompt = PromptTemplate(
-    input_variables=["customer_id", "industry", "revenue", "recent_purchases", "pattern_summary", "missing_products", "recommendations"],
-    template="""
-Generate a cross-sell and upsell report in markdown format:
-# Research Report: Cross-Sell and Upsell Opportunities for {customer_id}
+# Report layout, shared by the LLM prompt and the rule-based (fast mode) renderer
+report_template = """# Research Report: Cross-Sell and Upsell Opportunities for {customer_id}
 ## Introduction
 This report analyzes recent purchasing behavior and benchmarks against industry peers.
 
@@ -64,40 +50,121 @@ This report analyzes recent purchasing behavior and benchmarks against industry
 {recommendations}
 
 ## Conclusion
-Targeted campaigns focusing on these products can increase revenue and customer satisfaction.
+Targeted campaigns focusing on these products can increase revenue and customer satisfaction."""
+
+# Prompt for research report
+report_prompt = PromptTemplate(
+    input_variables=["customer_id", "industry", "revenue", "recent_purchases", "pattern_summary", "missing_products", "recommendations"],
+    template="""
+Generate a cross-sell and upsell report in markdown format:
+""" + report_template + """
 
 Output only the report in the specified markdown format. Do not include critiques, suggestions for improvement, or any additional commentary.
 """
 )
 
-def generate_research_report(customer_profile: Dict[str, Any], purchase_patterns: Dict[str, Any], scored_opportunities: List[Dict[str, Any]]) -> str:
+def _report_fields(customer_profile: Dict[str, Any], purchase_patterns: Dict[str, Any], scored_opportunities: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Prepare data for the prompt
+    pattern_summary = f"Frequent Purchases: {', '.join(purchase_patterns.get('frequent_products', []))}"
+    missing_products = ", ".join(purchase_patterns.get("missing_products", []))
+    recommendations = "\n".join(
+        [f"{i+1}. {opp['product']} ({opp.get('rationale', 'No rationale provided')})" for i, opp in enumerate(scored_opportunities)]
+    ) if scored_opportunities else "No recommendations available due to lack of scored opportunities."
+
+    return {
+        "customer_id": customer_profile.get("customer_id", "Unknown"),
+        "industry": customer_profile.get("industry", "Unknown"),
+        "revenue": customer_profile.get("revenue", 0.0),
+        "recent_purchases": ", ".join(customer_profile.get("recent_purchases", [])),
+        "pattern_summary": pattern_summary,
+        "missing_products": missing_products,
+        "recommendations": recommendations
+    }
+
+def render_static_report(customer_profile: Dict[str, Any], purchase_patterns: Dict[str, Any], scored_opportunities: List[Dict[str, Any]]) -> str:
+    """
+    Fills the report layout directly, without an LLM call.
+    """
+    return report_template.format(**_report_fields(customer_profile, purchase_patterns, scored_opportunities))
+
+def generate_research_report(customer_profile: Dict[str, Any], purchase_patterns: Dict[str, Any], scored_opportunities: List[Dict[str, Any]], mode: Optional[str] = None) -> str:
     """
     Generates a natural-language research report with recommendations.
     """
     try:
         if "error" in customer_profile or "error" in purchase_patterns:
             return "Error: Unable to generate report due to missing data"
-
-        # Prepare data for the prompt
-        pattern_summary = f"Frequent Purchases: {', '.join(purchase_patterns.get('frequent_products', []))}"
-        missing_products = ", ".join(purchase_patterns.get("missing_products", []))
-        recommendations = "\n".join(
-            [f"{i+1}. {opp['product']} ({opp.get('rationale', 'No rationale provided')})" for i, opp in enumerate(scored_opportunities)]
-        ) if scored_opportunities else "No recommendations available due to lack of scored opportunities."
+        if not uses_llm("recommendation_report", mode):
+            return render_static_report(customer_profile, purchase_patterns, scored_opportunities)
 
         # Generate report using LangChain
-        report = llm.invoke(
-            report_prompt.format(
-                customer_id=customer_profile.get("customer_id", "Unknown"),
-                industry=customer_profile.get("industry", "Unknown"),
-                revenue=customer_profile.get("revenue", 0.0),
-                recent_purchases=", ".join(customer_profile.get("recent_purchases", [])),
-                pattern_summary=pattern_summary,
-                missing_products=missing_products,
-                recommendations=recommendations
-            )
-        ).content.strip()
+        try:
+            report = cached_invoke(
+                get_llm("recommendation_report"),
+                report_prompt.format(**_report_fields(customer_profile, purchase_patterns, scored_opportunities)),
+                agent="recommendation_report"
+            ).strip()
+        except LLMUnavailableError:
+            record_fallback("recommendation_report")
+            return render_static_report(customer_profile, purchase_patterns, scored_opportunities)
+        return report
+
+    except Exception as e:
+        return f"Failed to generate report: {str(e)}"
+
+async def agenerate_research_report(customer_profile: Dict[str, Any], purchase_patterns: Dict[str, Any], scored_opportunities: List[Dict[str, Any]], mode: Optional[str] = None) -> str:
+    """
+    Async variant of generate_research_report.
+    """
+    try:
+        if "error" in customer_profile or "error" in purchase_patterns:
+            return "Error: Unable to generate report due to missing data"
+        if not uses_llm("recommendation_report", mode):
+            return render_static_report(customer_profile, purchase_patterns, scored_opportunities)
+
+        try:
+            report = (await acached_invoke(
+                get_llm("recommendation_report"),
+                report_prompt.format(**_report_fields(customer_profile, purchase_patterns, scored_opportunities)),
+                agent="recommendation_report"
+            )).strip()
+        except LLMUnavailableError:
+            record_fallback("recommendation_report")
+            return render_static_report(customer_profile, purchase_patterns, scored_opportunities)
         return report
 
     except Exception as e:
-        return f"Failed to generate report: {str(e)}"
\ No newline at end of file
+        return f"Failed to generate report: {str(e)}"
+
+async def astream_research_report(customer_profile: Dict[str, Any], purchase_patterns: Dict[str, Any], scored_opportunities: List[Dict[str, Any]], mode: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Streams the research report as text chunks as the model produces them.
+    Modes that skip the LLM yield the rendered report as a single chunk.
+    """
+    if "error" in customer_profile or "error" in purchase_patterns:
+        yield "Error: Unable to generate report due to missing data"
+        return
+    if not uses_llm("recommendation_report", mode):
+        yield render_static_report(customer_profile, purchase_patterns, scored_opportunities)
+        return
+
+    started = False
+    try:
+        async for chunk in astream_cached(
+            get_llm("recommendation_report"),
+            report_prompt.format(**_report_fields(customer_profile, purchase_patterns, scored_opportunities)),
+            agent="recommendation_report"
+        ):
+            # Match generate_research_report, which strips leading whitespace
+            if not started:
+                chunk = chunk.lstrip()
+                if not chunk:
+                    continue
+                started = True
+            yield chunk
+    except LLMUnavailableError:
+        # Nothing sent yet: the static report can still replace the stream
+        if started:
+            raise
+        record_fallback("recommendation_report")
+        yield render_static_report(customer_profile, purchase_patterns, scored_opportunities)
@@ -0,0 +1,393 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+from agents.metrics import record_resilience_event
+
+T = TypeVar("T")
+
+
+class LLMUnavailableError(Exception):
+    """
+    The LLM could not produce an answer; callers should use their static fallback.
+    """
+
+
+class CircuitOpenError(LLMUnavailableError):
+    pass
+
+
+class DeadlineExceededError(LLMUnavailableError):
+    pass
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+class ResiliencePolicy:
+    """
+    Timeout, retry and hedging settings for LLM calls. A timeout or hedge_delay
+    of 0 disables that feature.
+    """
+
+    def __init__(self, timeout: float = 30.0, retries: int = 2, backoff: float = 0.2, backoff_max: float = 2.0, hedge_delay: float = 0.0):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hedge_delay = hedge_delay
+
+    @classmethod
+    def from_env(cls) -> "ResiliencePolicy":
+        return cls(
+            timeout=_env_float("LLM_TIMEOUT", 30.0),
+            retries=int(os.getenv("LLM_RETRIES", "2")),
+            backoff=_env_float("LLM_RETRY_BACKOFF", 0.2),
+            backoff_max=_env_float("LLM_RETRY_BACKOFF_MAX", 2.0),
+            hedge_delay=_env_float("LLM_HEDGE_DELAY", 0.0)
+        )
+
+    def backoff_delay(self, attempt: int) -> float:
+        # Full jitter: spreads retries from concurrent requests apart
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failed calls, rejecting calls for
+    reset_timeout seconds. Then a single probe call is let through: success
+    closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probing or time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._probing and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> bool:
+        """
+        Counts a failed call; returns True when this failure opened the breaker.
+        """
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._probing = False
+                return True
+            return False
+
+    def release(self) -> None:
+        # A call that ended without an outcome (e.g. cancelled) frees the probe slot
+        with self._lock:
+            self._probing = False
+
+
+_policy: Optional[ResiliencePolicy] = None
+_breakers: Dict[str, CircuitBreaker] = {}
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+# Absolute time.monotonic() by which every LLM call of the current request must finish
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+
+def get_policy() -> ResiliencePolicy:
+    global _policy
+    if _policy is None:
+        _policy = ResiliencePolicy.from_env()
+    return _policy
+
+
+def set_policy(policy: Optional[ResiliencePolicy]) -> None:
+    """
+    Replaces the policy (None re-reads the environment on next use).
+    """
+    global _policy
+    _policy = policy
+
+
+def get_breaker(key: str) -> CircuitBreaker:
+    """
+    Returns the breaker for a model; agents sharing a model share its health.
+    """
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.get(key)
+            if breaker is None:
+                breaker = _breakers[key] = CircuitBreaker(
+                    int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+                    _env_float("LLM_BREAKER_RESET", 30.0)
+                )
+    return breaker
+
+
+def reset_breakers() -> None:
+    with _lock:
+        _breakers.clear()
+
+
+def breaker_states() -> Dict[str, str]:
+    return {key: breaker.state for key, breaker in list(_breakers.items())}
+
+
+@contextmanager
+def request_budget(seconds: Optional[float] = None) -> Iterator[None]:
+    """
+    Bounds the total time LLM calls made inside the block may take, retries and
+    waits included. Defaults to $LLM_REQUEST_BUDGET (0 disables). A nested
+    budget never extends the enclosing one.
+    """
+    if seconds is None:
+        seconds = _env_float("LLM_REQUEST_BUDGET", 60.0)
+    previous = deadline = _deadline.get()
+    if seconds > 0:
+        deadline = min(deadline, time.monotonic() + seconds) if deadline is not None else time.monotonic() + seconds
+    _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        # set() rather than reset(): async generators may close in another context
+        _deadline.set(previous)
+
+
+def remaining_budget() -> Optional[float]:
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _attempt_timeout(policy: ResiliencePolicy) -> Optional[float]:
+    left = remaining_budget()
+    if left is not None and left <= 0:
+        raise DeadlineExceededError("LLM request budget exhausted")
+    timeout = policy.timeout or None
+    if left is None:
+        return timeout
+    return left if timeout is None else min(timeout, left)
+
+
+def _admit(agent: str, key: str) -> CircuitBreaker:
+    left = remaining_budget()
+    if left is not None and left <= 0:
+        raise DeadlineExceededError("LLM request budget exhausted")
+    breaker = get_breaker(key)
+    if not breaker.allow():
+        record_resilience_event(agent, "short_circuit")
+        raise CircuitOpenError(f"Circuit open for {key}")
+    return breaker
+
+
+def _record_failure(agent: str, breaker: CircuitBreaker) -> None:
+    if breaker.record_failure():
+        record_resilience_event(agent, "circuit_opened")
+
+
+def _may_retry(agent: str, policy: ResiliencePolicy, attempt: int) -> Optional[float]:
+    if attempt >= policy.retries:
+        return None
+    delay = policy.backoff_delay(attempt)
+    left = remaining_budget()
+    if left is not None and delay >= left:
+        return None
+    record_resilience_event(agent, "retry")
+    return delay
+
+
+def _timeout_error(agent: str, timeout: Optional[float], error: Exception) -> Exception:
+    # Without a timeout the TimeoutError came from the provider itself: an ordinary failure
+    if timeout is None:
+        return LLMUnavailableError(str(error) or "LLM call timed out")
+    record_resilience_event(agent, "timeout")
+    return DeadlineExceededError(f"LLM call timed out after {timeout:.2f}s")
+
+
+async def _ahedged(agent: str, attempt: Callable[[], Awaitable[T]], hedge_delay: float) -> T:
+    if not hedge_delay:
+        return await attempt()
+    tasks = [asyncio.ensure_future(attempt())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if not done:
+            # The first call is slow: race a duplicate and keep whichever answers first
+            record_resilience_event(agent, "hedge")
+            tasks.append(asyncio.ensure_future(attempt()))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not tasks[0]:
+                        record_resilience_event(agent, "hedge_won")
+                    return task.result()
+        return tasks[0].result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def acall(agent: str, key: str, attempt: Callable[[], Awaitable[T]], policy: Optional[ResiliencePolicy] = None) -> T:
+    """
+    Runs an async LLM call with a per-call timeout bounded by the request budget,
+    jittered retries, optional hedging and the model's circuit breaker. Raises
+    LLMUnavailableError when no answer could be obtained.
+    """
+    policy = policy or get_policy()
+    breaker = _admit(agent, key)
+    attempt_number = 0
+    try:
+        while True:
+            try:
+                # Inside the try: an exhausted budget must still settle the breaker
+                timeout = _attempt_timeout(policy)
+                result = await asyncio.wait_for(_ahedged(agent, attempt, policy.hedge_delay), timeout)
+                breaker.record_success()
+                return result
+            except asyncio.TimeoutError as e:
+                error: Exception = _timeout_error(agent, timeout, e)
+            except LLMUnavailableError as e:
+                error = e
+            except Exception as e:
+                error = LLMUnavailableError(str(e))
+            delay = _may_retry(agent, policy, attempt_number)
+            if delay is None:
+                _record_failure(agent, breaker)
+                raise error
+            attempt_number += 1
+            await asyncio.sleep(delay)
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_SYNC_WORKERS", "16")), thread_name_prefix="llm-call")
+    return _executor
+
+
+def _hedged(agent: str, attempt: Callable[[], T], hedge_delay: float, timeout: Optional[float]) -> T:
+    if not hedge_delay and timeout is None:
+        return attempt()
+    # Calls run on worker threads so the caller can stop waiting; a call that
+    # overruns finishes in the background and its result is dropped
+    deadline = None if timeout is None else time.monotonic() + timeout
+    futures = [_get_executor().submit(attempt)]
+    if hedge_delay and (timeout is None or hedge_delay < timeout):
+        done, _ = wait(futures, timeout=hedge_delay)
+        if not done:
+            record_resilience_event(agent, "hedge")
+            futures.append(_get_executor().submit(attempt))
+    pending = set(futures)
+    while pending:
+        left = None if deadline is None else max(0.0, deadline - time.monotonic())
+        done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+        if not done:
+            for future in pending:
+                future.cancel()
+            raise TimeoutError()
+        for future in done:
+            if future.exception() is None:
+                if future is not futures[0]:
+                    record_resilience_event(agent, "hedge_won")
+                for other in pending:
+                    other.cancel()
+                return future.result()
+    return futures[0].result()
+
+
+def call(agent: str, key: str, attempt: Callable[[], T], policy: Optional[ResiliencePolicy] = None) -> T:
+    """
+    Blocking variant of acall.
+    """
+    policy = policy or get_policy()
+    breaker = _admit(agent, key)
+    attempt_number = 0
+    while True:
+        try:
+            timeout = _attempt_timeout(policy)
+            result = _hedged(agent, attempt, policy.hedge_delay, timeout)
+            breaker.record_success()
+            return result
+        except TimeoutError as e:
+            error: Exception = _timeout_error(agent, timeout, e)
+        except LLMUnavailableError as e:
+            error = e
+        except Exception as e:
+            error = LLMUnavailableError(str(e))
+        delay = _may_retry(agent, policy, attempt_number)
+        if delay is None:
+            _record_failure(agent, breaker)
+            raise error
+        attempt_number += 1
+        time.sleep(delay)
+
+
+async def aguard_stream(agent: str, key: str, stream: AsyncIterator[Any], policy: Optional[ResiliencePolicy] = None) -> AsyncIterator[Any]:
+    """
+    Passes a streaming response through the model's circuit breaker. Each chunk
+    must arrive within the per-call timeout (bounded by the request budget).
+    Streams are not retried or hedged once started.
+    """
+    policy = policy or get_policy()
+    breaker = _admit(agent, key)
+    try:
+        while True:
+            try:
+                timeout = _attempt_timeout(policy)
+                chunk = await asyncio.wait_for(anext(stream), timeout)
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError as e:
+                _record_failure(agent, breaker)
+                if timeout is None:
+                    raise LLMUnavailableError(str(e) or "LLM stream timed out") from e
+                record_resilience_event(agent, "timeout")
+                raise DeadlineExceededError(f"LLM stream stalled for {timeout:.2f}s")
+            except LLMUnavailableError:
+                _record_failure(agent, breaker)
+                raise
+            except Exception as e:
+                _record_failure(agent, breaker)
+                raise LLMUnavailableError(str(e)) from e
+            yield chunk
+    except (asyncio.CancelledError, GeneratorExit):
+        breaker.release()
+        raise
+    breaker.record_success()
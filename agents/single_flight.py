@@ -0,0 +1,68 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from agents.metrics import COALESCED_REQUESTS
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one execution and keeps
+    finished results for result_ttl seconds.
+    """
+
+    def __init__(self, result_ttl: float = 0.0, max_results: int = 1024):
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._results: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def _cached(self, key: Hashable) -> Optional[Tuple[float, Any]]:
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._results[key]
+            return None
+        self._results.move_to_end(key)
+        return entry
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._results[key] = (time.monotonic() + self.result_ttl, value)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]], cacheable: Callable[[Any], bool] = lambda value: True) -> Any:
+        """
+        Returns func()'s result, sharing one execution among concurrent callers
+        with the same key. Results passing cacheable are reused until they expire.
+        """
+        cached = self._cached(key)
+        if cached is not None:
+            COALESCED_REQUESTS.inc("cached")
+            return cached[1]
+
+        future = self._inflight.get(key)
+        if future is not None:
+            COALESCED_REQUESTS.inc("shared")
+            # Shielded so a disconnecting follower does not cancel the shared run
+            return await asyncio.shield(future)
+
+        COALESCED_REQUESTS.inc("leader")
+        future = asyncio.ensure_future(func())
+        self._inflight[key] = future
+        try:
+            value = await asyncio.shield(future)
+        finally:
+            if future.done():
+                self._inflight.pop(key, None)
+            else:
+                # The leader was cancelled; let the run finish for the followers
+                future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        if self.result_ttl > 0 and cacheable(value):
+            self._store(key, value)
+        return value
+
+    def clear(self) -> None:
+        self._results.clear()
@@ -0,0 +1,197 @@
+import ast
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar
+from pydantic import BaseModel, ConfigDict, Field, RootModel, ValidationError
+from agents.metrics import record_parse
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+M = TypeVar("M", bound=BaseModel)
+
+_FENCE = re.compile(r"```[A-Za-z]*\s*(.*?)(?:```|$)", re.S)
+
+
+def loads(text: str) -> Any:
+    """
+    Parses JSON with orjson when installed, else the standard library.
+    Both raise a ValueError subclass on bad input.
+    """
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+class CustomerProfile(BaseModel):
+    # Every field is optional: the caller keeps its own value for any left out
+    model_config = ConfigDict(extra="ignore")
+    customer_id: Optional[str] = None
+    customer_name: Optional[str] = None
+    industry: Optional[str] = None
+    revenue: Optional[float] = None
+    number_of_employees: Optional[int] = None
+    location: Optional[str] = None
+    recent_purchases: Optional[List[str]] = None
+
+
+class PurchasePatterns(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    frequent_products: List[str]
+    missing_products: List[str]
+
+
+class AffinityList(RootModel[List[str]]):
+    pass
+
+
+class ScoredOpportunity(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    product: str
+    score: float = Field(ge=0.0, le=1.0)
+    rationale: str
+
+
+class ScoredOpportunities(RootModel[List[ScoredOpportunity]]):
+    pass
+
+
+def _balanced(fragment: str, allow_truncated: bool = True) -> Optional[str]:
+    """
+    Returns the first complete JSON value in fragment. A truncated value is cut
+    back to its last complete top-level element (e.g. the last whole scored
+    opportunity, or the last whole customer of a batch) and closed, unless
+    allow_truncated is False.
+    """
+    closers: List[str] = []
+    quote = None
+    escaped = False
+    safe: Optional[int] = None
+    for index, char in enumerate(fragment):
+        if quote is not None:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+            continue
+        if char in "\"'":
+            quote = char
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not closers:
+                return None
+            closers.pop()
+            if not closers:
+                return fragment[:index + 1]
+        elif char == "," and len(closers) == 1:
+            safe = index
+    if safe is None or not allow_truncated:
+        return None
+    return fragment[:safe] + closers[0]
+
+
+def extract_json(text: str, allow_truncated: bool = True) -> Tuple[Any, bool]:
+    """
+    Parses model output that should be JSON. Tolerates markdown fences, prose
+    around the value, truncated output (unless allow_truncated is False) and
+    Python-literal dicts (single quotes). Returns (value, repaired) where
+    repaired is True when the raw text was not valid JSON as-is; raises
+    ValueError when nothing usable is found.
+    """
+    text = text.strip()
+    try:
+        return loads(text), False
+    except ValueError:
+        pass
+
+    fenced = _FENCE.search(text)
+    candidate = fenced.group(1).strip() if fenced else text
+    starts = [i for i in (candidate.find("{"), candidate.find("[")) if i != -1]
+    if not starts:
+        raise ValueError("No JSON value in model output")
+    fragment = _balanced(candidate[min(starts):], allow_truncated)
+    if fragment is None:
+        raise ValueError("Incomplete JSON value in model output")
+    try:
+        return loads(fragment), True
+    except ValueError:
+        pass
+    try:
+        # Literals only: never evaluates code
+        return ast.literal_eval(fragment), True
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        raise ValueError("Unparseable model output")
+
+
+def validate_output(value: Any, schema: Type[M], agent: str, repaired: bool = False) -> Optional[M]:
+    """
+    Validates an already-parsed value against schema; None if it does not fit.
+    """
+    try:
+        parsed = schema.model_validate(value)
+    except ValidationError:
+        record_parse(agent, "invalid")
+        return None
+    record_parse(agent, "repaired" if repaired else "ok")
+    return parsed
+
+
+def parse_output(text: str, schema: Type[M], agent: str) -> Optional[M]:
+    """
+    Extracts and validates model output; None (and a counted failure) when the
+    text holds no value matching schema.
+    """
+    try:
+        value, repaired = extract_json(text)
+    except ValueError:
+        record_parse(agent, "unparseable")
+        return None
+    return validate_output(value, schema, agent, repaired)
+
+
+def conforms(text: str, schema: Type[M]) -> bool:
+    """
+    True when parse_output would accept text without cutting off a truncated
+    value. Records no parse metrics; used to decide whether a response is worth
+    caching, so a truncated answer is asked for again rather than kept.
+    """
+    try:
+        value, _ = extract_json(text, allow_truncated=False)
+        schema.model_validate(value)
+    except (ValueError, ValidationError):
+        return False
+    return True
+
+
+def conforms_keyed(text: str, schema: Type[M], keys: List[str]) -> bool:
+    """
+    True when text is a complete batched response with a valid schema item for every key.
+    """
+    try:
+        value, _ = extract_json(text, allow_truncated=False)
+        if not isinstance(value, dict):
+            return False
+        for key in keys:
+            schema.model_validate(value.get(key))
+    except (ValueError, ValidationError):
+        return False
+    return True
+
+
+def parse_keyed_output(text: str, agent: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    Extracts a batched response keyed by customer ID. Returns ({}, False) when the
+    response is not a JSON object, so every customer in the batch falls back;
+    items are validated one by one with validate_output.
+    """
+    try:
+        value, repaired = extract_json(text)
+    except ValueError:
+        record_parse(agent, "unparseable")
+        return {}, False
+    if not isinstance(value, dict):
+        record_parse(agent, "invalid")
+        return {}, False
+    return value, repaired
@@ -0,0 +1,41 @@
+import argparse
+import asyncio
+import json
+import sys
+from typing import List, Optional
+
+from main import stream_recommendations
+
+
+async def run_batch(customer_ids: Optional[List[str]], concurrency: int, output: str, mode: Optional[str] = None, batch_prompts: bool = False) -> None:
+    out = sys.stdout if output == "-" else open(output, "w")
+    try:
+        async for item in stream_recommendations(customer_ids, concurrency, mode, batch_prompts):
+            if "summary" in item:
+                summary = item["summary"]
+                print(
+                    f"Processed {summary['customers']} customers "
+                    f"({summary['succeeded']} ok, {summary['failed']} failed) in "
+                    f"{summary['elapsed_seconds']}s: {summary['customers_per_second']} customers/sec",
+                    file=sys.stderr
+                )
+            out.write(json.dumps(item, default=str) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate cross-sell recommendations for many customers as NDJSON.")
+    parser.add_argument("customer_ids", nargs="*", help="Customer IDs to process (default: every customer in DATA_FILE)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum pipelines running at once")
+    parser.add_argument("--mode", choices=["fast", "hybrid", "llm"], help="Pipeline mode (default: $PIPELINE_MODE or llm)")
+    parser.add_argument("--batch-prompts", action="store_true", help="Score and enrich several customers per LLM prompt")
+    parser.add_argument("--output", default="-", help="NDJSON output path ('-' for stdout)")
+    args = parser.parse_args()
+    asyncio.run(run_batch(args.customer_ids or None, args.concurrency, args.output, args.mode, args.batch_prompts))
+
+
+if __name__ == "__main__":
+    main()
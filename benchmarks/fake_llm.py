@@ -0,0 +1,68 @@
+import asyncio
+import random
+import time
+from typing import Any, List, Optional
+from langchain_community.llms.fake import FakeListLLM
+from pydantic import PrivateAttr
+from agents.llm_provider import fake_responses, set_llm
+
+AGENTS = ["customer_context", "purchase_pattern", "product_affinity", "opportunity_scoring", "recommendation_report"]
+
+
+class FakeLLMError(RuntimeError):
+    pass
+
+
+class LatencyFakeLLM(FakeListLLM):
+    """
+    FakeListLLM that waits latency seconds (plus up to +/- jitter) before
+    answering. error_rate of calls raise FakeLLMError and slow_rate of calls
+    take slow_latency instead, to exercise timeouts, retries and the circuit
+    breaker. All randomness comes from a seeded generator, so runs are repeatable.
+    """
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    slow_rate: float = 0.0
+    slow_latency: float = 0.0
+    seed: int = 0
+    _rng: random.Random = PrivateAttr(default=None)
+
+    def _plan(self) -> tuple:
+        if self._rng is None:
+            self._rng = random.Random(self.seed)
+        delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+        if self._rng.random() < self.slow_rate:
+            delay = self.slow_latency
+        return delay, self._rng.random() < self.error_rate
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        delay, fail = self._plan()
+        time.sleep(delay)
+        if fail:
+            raise FakeLLMError("Injected LLM failure")
+        return super()._call(prompt, stop=stop, **kwargs)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        delay, fail = self._plan()
+        await asyncio.sleep(delay)
+        if fail:
+            raise FakeLLMError("Injected LLM failure")
+        return await super()._acall(prompt, stop=stop, **kwargs)
+
+
+def install(latency: float = 0.0, jitter: float = 0.0, seed: int = 0, error_rate: float = 0.0, slow_rate: float = 0.0, slow_latency: float = 0.0) -> None:
+    """
+    Pins a LatencyFakeLLM with each agent's canned responses for every agent.
+    Call after the agent modules are imported, since they register the responses.
+    """
+    for offset, agent in enumerate(AGENTS):
+        set_llm(agent, LatencyFakeLLM(
+            responses=fake_responses(agent),
+            latency=latency,
+            jitter=jitter,
+            error_rate=error_rate,
+            slow_rate=slow_rate,
+            slow_latency=slow_latency,
+            seed=seed + offset
+        ))
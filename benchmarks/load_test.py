@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import httpx
+import numpy as np
+from benchmarks.synthetic_data import generate_csv
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# Metrics compared against a baseline; True when higher is better
+COMPARED_METRICS = {"p50_ms": False, "p95_ms": False, "p99_ms": False, "requests_per_second": True}
+
+
+def configure_environment(data_file: str, llm_cache: bool, result_cache_ttl: float) -> Dict[str, str]:
+    """
+    Points the app at the benchmark data. The LLM cache and the coalesced result
+    cache are off by default so every request exercises the whole pipeline.
+    """
+    settings = {
+        "DATA_FILE": data_file,
+        "LLM_PROVIDER": "fake",
+        "LLM_CACHE_BACKEND": "memory" if llm_cache else "none",
+        "RESULT_CACHE_TTL": str(result_cache_ttl),
+        "MATERIALIZE_RESULTS": "false",
+        "METRICS_ENABLED": "true",
+        "LOG_LEVEL": "WARNING"
+    }
+    os.environ.update(settings)
+    return settings
+
+
+def peak_rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """
+    Peak resident set size of this process, or of pid (Linux only) in MiB.
+    """
+    if pid is None:
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(np.mean(values)), 3)
+    }
+
+
+async def drive(client: httpx.AsyncClient, customer_ids: List[str], concurrency: int, requests: int, mode: str) -> Dict[str, Any]:
+    """
+    Closed-loop load: concurrency workers each send the next /recommendation
+    request as soon as their previous one returns, cycling through customer_ids.
+    """
+    latencies: List[float] = []
+    node_timings: Dict[str, List[float]] = {}
+    errors = 0
+    next_request = 0
+
+    async def worker() -> None:
+        nonlocal errors, next_request
+        while next_request < requests:
+            customer_id = customer_ids[next_request % len(customer_ids)]
+            next_request += 1
+            start = time.perf_counter()
+            response = await client.get("/recommendation", params={"customer_id": customer_id, "mode": mode, "timings": "true"})
+            latencies.append((time.perf_counter() - start) * 1000)
+            body = response.json() if response.status_code == 200 else {"error": response.status_code}
+            if "error" in body:
+                errors += 1
+                continue
+            for node, ms in body.get("timings", {}).items():
+                node_timings.setdefault(node, []).append(ms)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 3) if elapsed > 0 else None,
+        **_percentiles(latencies),
+        "nodes": {node: _percentiles(values) for node, values in sorted(node_timings.items())}
+    }
+
+
+async def _run_levels(client: httpx.AsyncClient, customer_ids: List[str], levels: List[int], requests: int, mode: str, warmup: int) -> List[Dict[str, Any]]:
+    # Warm-up loads the purchase data and the affinity model outside the measurements
+    await drive(client, customer_ids, 1, warmup, mode)
+    return [await drive(client, customer_ids, level, requests, mode) for level in levels]
+
+
+async def run_inprocess(levels: List[int], requests: int, mode: str, warmup: int, latency: float, jitter: float, seed: int, faults: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """
+    Drives the app through httpx's ASGI transport inside this process.
+    """
+    import main
+    from agents.data_store import get_store
+    from benchmarks.fake_llm import install
+    install(latency, jitter, seed, **(faults or {}))
+    customer_ids = get_store().customer_ids()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        runs = await _run_levels(client, customer_ids, levels, requests, mode, warmup)
+    rss = peak_rss_mb()
+    return [{"target": "inprocess", **run, "peak_rss_mb": rss} for run in runs]
+
+
+async def run_uvicorn(levels: List[int], requests: int, mode: str, warmup: int, latency: float, jitter: float, seed: int, port: int, workers: int = 1, faults: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """
+    Starts `uvicorn benchmarks.server:app` in a subprocess and drives it over HTTP.
+    """
+    env = {**os.environ, "BENCH_LLM_LATENCY": str(latency), "BENCH_LLM_JITTER": str(jitter), "BENCH_SEED": str(seed)}
+    env.update({f"BENCH_LLM_{name.upper()}": str(value) for name, value in (faults or {}).items()})
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.server:app", "--port", str(port), "--log-level", "warning", "--workers", str(workers)],
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    try:
+        from agents.data_store import get_store
+        customer_ids = get_store().customer_ids()
+        limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None, limits=limits) as client:
+            deadline = time.time() + 60
+            while True:
+                try:
+                    await client.get("/cache/stats")
+                    break
+                except httpx.TransportError:
+                    if time.time() > deadline or server.poll() is not None:
+                        raise RuntimeError("uvicorn did not start")
+                    await asyncio.sleep(0.2)
+            runs = await _run_levels(client, customer_ids, levels, requests, mode, warmup)
+        rss = peak_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    return [{"target": "uvicorn", **run, "peak_rss_mb": rss} for run in runs]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Percentage change of each compared metric for every (target, concurrency)
+    present in both reports. Positive "regression" values are worse.
+    """
+    previous = {(run["target"], run["concurrency"]): run for run in baseline["runs"]}
+    rows = []
+    for run in current["runs"]:
+        before = previous.get((run["target"], run["concurrency"]))
+        if before is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if not before.get(metric) or run.get(metric) is None:
+                continue
+            change = (run[metric] - before[metric]) / before[metric] * 100
+            rows.append({
+                "target": run["target"],
+                "concurrency": run["concurrency"],
+                "metric": metric,
+                "baseline": before[metric],
+                "current": run[metric],
+                "change_pct": round(change, 1),
+                "regression_pct": round(-change if higher_is_better else change, 1)
+            })
+    return rows
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{'target':<10} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'rss MiB':>8}")
+    for run in report["runs"]:
+        print(
+            f"{run['target']:<10} {run['concurrency']:>5} {run['requests_per_second']:>9} {run['p50_ms']:>9} "
+            f"{run['p95_ms']:>9} {run['p99_ms']:>9} {run['errors']:>7} {run['peak_rss_mb']!s:>8}"
+        )
+        for node, stats in run["nodes"].items():
+            print(f"{'':<10} {'':>5} {node:>21}: p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load-test /recommendation with a deterministic fake LLM.")
+    parser.add_argument("--rows", type=int, default=10_000, help="Synthetic CSV rows (ignored with --data)")
+    parser.add_argument("--customers", type=int, help="Synthetic customers (default: rows / 10)")
+    parser.add_argument("--data", help="Use an existing CSV or Parquet dataset instead of synthetic data")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--mode", choices=["fast", "hybrid", "llm"], default="llm")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Simulated seconds per LLM call")
+    parser.add_argument("--llm-jitter", type=float, default=0.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of LLM calls that fail")
+    parser.add_argument("--llm-slow-rate", type=float, default=0.0, help="Fraction of LLM calls that take --llm-slow-latency")
+    parser.add_argument("--llm-slow-latency", type=float, default=0.0)
+    parser.add_argument("--llm-cache", action="store_true", help="Keep the in-memory LLM cache on")
+    parser.add_argument("--result-cache-ttl", type=float, default=0, help="RESULT_CACHE_TTL for the app")
+    parser.add_argument("--target", choices=["inprocess", "uvicorn", "both"], default="inprocess")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (RSS is reported for the parent only)")
+    parser.add_argument("--save", metavar="NAME", help=f"Save the report as a baseline in {BASELINE_DIR}")
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against a saved baseline report")
+    parser.add_argument("--max-regression", type=float, help="Exit 1 if any compared metric regresses by more than this percent")
+    args = parser.parse_args()
+
+    data_file = args.data
+    if data_file is None:
+        customers = args.customers or max(1, args.rows // 10)
+        data_file = os.path.join(tempfile.gettempdir(), f"crosssell_bench_{args.rows}_{customers}_{args.seed}.csv")
+        if not os.path.exists(data_file):
+            print(f"Generating {args.rows} rows for {customers} customers at {data_file}", file=sys.stderr)
+            generate_csv(data_file, args.rows, customers, args.seed)
+    settings = configure_environment(data_file, args.llm_cache, args.result_cache_ttl)
+    levels = [int(level) for level in args.concurrency.split(",")]
+    faults = {"error_rate": args.llm_error_rate, "slow_rate": args.llm_slow_rate, "slow_latency": args.llm_slow_latency}
+
+    runs: List[Dict[str, Any]] = []
+    if args.target in ("inprocess", "both"):
+        runs += asyncio.run(run_inprocess(levels, args.requests, args.mode, args.warmup, args.llm_latency, args.llm_jitter, args.seed, faults))
+    if args.target in ("uvicorn", "both"):
+        runs += asyncio.run(run_uvicorn(levels, args.requests, args.mode, args.warmup, args.llm_latency, args.llm_jitter, args.seed, args.port, args.workers, faults))
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "rows": None if args.data else args.rows,
+            "data": args.data,
+            "mode": args.mode,
+            "requests": args.requests,
+            "llm_latency": args.llm_latency,
+            "llm_jitter": args.llm_jitter,
+            **{f"llm_{name}": value for name, value in faults.items()},
+            "seed": args.seed,
+            "environment": settings
+        },
+        "runs": runs
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save}.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {path}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline)
+        worst = 0.0
+        for row in rows:
+            worst = max(worst, row["regression_pct"])
+            print(
+                f"{row['target']:<10} {row['concurrency']:>5} {row['metric']:<20} "
+                f"{row['baseline']} -> {row['current']} ({row['change_pct']:+}%)"
+            )
+        if args.max_regression is not None and worst > args.max_regression:
+            print(f"Regression of {worst}% exceeds {args.max_regression}%", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import os
+from main import app
+from benchmarks.fake_llm import install
+
+# Entry point for `uvicorn benchmarks.server:app`: the real app with the fake
+# LLM configured by $BENCH_LLM_* and $BENCH_SEED
+install(
+    latency=float(os.getenv("BENCH_LLM_LATENCY", "0")),
+    jitter=float(os.getenv("BENCH_LLM_JITTER", "0")),
+    seed=int(os.getenv("BENCH_SEED", "0")),
+    error_rate=float(os.getenv("BENCH_LLM_ERROR_RATE", "0")),
+    slow_rate=float(os.getenv("BENCH_LLM_SLOW_RATE", "0")),
+    slow_latency=float(os.getenv("BENCH_LLM_SLOW_LATENCY", "0"))
+)
@@ -0,0 +1,104 @@
+import argparse
+import os
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+# Same 19 columns, in the same order, as data/customer_data_purchases.csv
+COLUMNS = [
+    "Customer ID", "Product", "Quantity", "Unit Price (USD)", "Total Price (USD)", "Purchase Date",
+    "Customer Name", "Industry", "Annual Revenue (USD)", "Number of Employees", "Customer Priority",
+    "Rating", "Account Type", "Location", "Current Products", "Product Usage (%)",
+    "Cross-Sell Synergy", "Last Activity Date", "Opportunity Stage"
+]
+
+PRODUCTS = [
+    "Drill Bits", "Protective Gloves", "Drills", "Backup Batteries", "Advanced Analytics", "Generators",
+    "Workflow Automation", "Safety Gear", "Collaboration Suite", "API Integrations", "Power Cords",
+    "AI Insights Module", "Reporting Dashboard", "Core Management Platform", "Heavy Equipment"
+]
+INDUSTRIES = ["Electronics", "Apparel", "Hospitality", "Energy", "Construction"]
+UNIT_PRICES = [100, 250, 500, 750, 1000]
+PRIORITIES = ["Low", "Medium", "High"]
+RATINGS = ["Cold", "Warm", "Hot"]
+ACCOUNT_TYPES = ["Customer - Direct", "Customer - Channel"]
+LOCATIONS = ["Austin, TX, USA", "Burlington, NC, USA", "Chicago, IL, USA", "New York, NY, USA", "Paris, France"]
+STAGES = ["Prospecting", "Negotiation/Review", "Closed Won"]
+NAME_WORDS = ["Edge", "Burlington", "Grand", "United", "Pyramid", "Summit", "Harbor", "Vertex", "Atlas", "Pioneer"]
+NAME_SUFFIXES = ["Communications", "Textiles Corp", "Hotels & Resorts", "Oil & Gas Corp.", "Construction Inc.", "Holdings", "Systems"]
+
+START_DATE = np.datetime64("2024-01-01")
+CHUNK_ROWS = 250_000
+
+
+def _customers(count: int, rng: np.random.Generator) -> pd.DataFrame:
+    width = max(3, len(str(count)))
+    index = np.arange(1, count + 1)
+    products = np.array(PRODUCTS)
+    return pd.DataFrame({
+        "Customer ID": [f"C{i:0{width}d}" for i in index],
+        "Customer Name": [
+            f"{NAME_WORDS[i % len(NAME_WORDS)]} {NAME_SUFFIXES[(i // len(NAME_WORDS)) % len(NAME_SUFFIXES)]} {i}"
+            for i in index
+        ],
+        "Industry": rng.choice(INDUSTRIES, count),
+        "Annual Revenue (USD)": rng.integers(10, 6000, count) * 1_000_000,
+        "Number of Employees": rng.integers(50, 150_000, count),
+        "Customer Priority": rng.choice(PRIORITIES, count),
+        "Rating": rng.choice(RATINGS, count),
+        "Account Type": rng.choice(ACCOUNT_TYPES, count),
+        "Location": rng.choice(LOCATIONS, count),
+        "Current Products": rng.choice(products, count),
+        "Product Usage (%)": rng.integers(10, 101, count),
+        "Cross-Sell Synergy": [f"{p}, {chr(65 + i % 26)}" for i, p in enumerate(rng.choice(products, count))],
+        "Last Activity Date": (START_DATE + rng.integers(0, 365, count)).astype(str),
+        "Opportunity Stage": rng.choice(STAGES, count)
+    })
+
+
+def generate_csv(path: str, rows: int, customers: Optional[int] = None, seed: int = 0) -> str:
+    """
+    Writes a synthetic purchase CSV with the production schema. The output is
+    fully determined by rows, customers (default rows // 10) and seed, and is
+    written in chunks so 10M-row files never need to fit in memory at once.
+    """
+    rng = np.random.default_rng(seed)
+    if customers is None:
+        customers = max(1, rows // 10)
+    dimension = _customers(customers, rng)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    written = 0
+    with open(tmp_path, "w", newline="") as f:
+        while written < rows:
+            size = min(CHUNK_ROWS, rows - written)
+            # Round-robin owners (so every customer has rows), shuffled within the chunk
+            owners = rng.permutation(np.arange(written, written + size) % customers)
+            quantity = rng.integers(1, 10, size)
+            unit_price = rng.choice(UNIT_PRICES, size)
+            chunk = dimension.iloc[owners].reset_index(drop=True)
+            chunk["Product"] = rng.choice(PRODUCTS, size)
+            chunk["Quantity"] = quantity
+            chunk["Unit Price (USD)"] = unit_price
+            chunk["Total Price (USD)"] = quantity * unit_price
+            chunk["Purchase Date"] = (START_DATE + rng.integers(0, 450, size)).astype(str)
+            chunk[COLUMNS].to_csv(f, header=written == 0, index=False)
+            written += size
+    os.replace(tmp_path, path)
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic purchase CSV for benchmarks.")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--customers", type=int, help="Distinct customers (default: rows / 10)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_csv(args.path, args.rows, args.customers, args.seed)
+    print(f"Wrote {args.rows} rows to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
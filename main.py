@@ -1,105 +1,175 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel
 from dotenv import load_dotenv
-from langgraph.graph import StateGraph, END
-from typing import Dict, Any, List
+from langgraph.graph import StateGraph, START, END
+from typing import Annotated, Dict, Any, List, Optional, AsyncIterator, Literal, TypedDict
+import asyncio
+from contextlib import aclosing, asynccontextmanager
+import json
 import os
+import time
 import logging
 
-# Setup logging
-logging.basicConfig(level=logging.DEBUG)
+# Load environment before the agents read their settings
+load_dotenv()
+
+# Setup logging (LOG_LEVEL=DEBUG dumps node inputs and pipeline state)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 # Import agent functions
-from agents.customer_context_agent import get_customer_profile
-from agents.purchase_pattern_agent import analyze_purchase_patterns
-from agents.product_affinity_agent import suggest_related_products
-from agents.opportunity_scoring_agent import score_opportunities
-from agents.recommendation_report_agent import generate_research_report
+from agents.customer_context_agent import aget_customer_profile
+from agents.purchase_pattern_agent import aanalyze_purchase_patterns
+from agents.product_affinity_agent import asuggest_related_products, asuggest_related_products_batch
+from agents.opportunity_scoring_agent import ascore_opportunities, ascore_opportunities_batch
+from agents.recommendation_report_agent import agenerate_research_report, astream_research_report
+from agents.llm_cache import get_cache
+from agents.data_store import get_store
+from agents.concurrency import run_blocking
+from agents.pipeline_mode import resolve_mode
+from agents.metrics import REQUEST_LATENCY, instrument_node, render_metrics
+from agents.single_flight import SingleFlight
+from agents.materialized import MaterializedStore
+from agents.resilience import request_budget, breaker_states
+from agents.llm_provider import provider_name
+from agents.http_responses import FastJSONResponse, conditional_json, parse_fields, project
 
-# Initialize FastAPI and environment
-load_dotenv()
-app = FastAPI(title="Cross-Sell API")
+# Precomputed results for the deployment's default mode, refreshed in the
+# background when the purchase data changes (MATERIALIZE_RESULTS=true)
+MATERIALIZE_RESULTS = os.getenv("MATERIALIZE_RESULTS", "false").lower() in ("1", "true", "yes")
+materialized = MaterializedStore(
+    lambda customer_id: run_pipeline(customer_id),
+    concurrency=int(os.getenv("MATERIALIZE_CONCURRENCY", "4"))
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    refresher = None
+    if MATERIALIZE_RESULTS:
+        refresher = asyncio.create_task(materialized.run_forever(float(os.getenv("MATERIALIZE_INTERVAL", "60"))))
+    yield
+    if refresher is not None:
+        refresher.cancel()
+
+# Initialize FastAPI
+app = FastAPI(title="Cross-Sell API", lifespan=lifespan, default_response_class=FastJSONResponse)
+
+PipelineMode = Literal["fast", "hybrid", "llm"]
+
+# Bump when a change alters pipeline output, so coalesced/cached results from
+# the previous pipeline are never served
+PIPELINE_VERSION = os.getenv("PIPELINE_VERSION", "3")
 
-# Define state to pass between agent types
-class AgentState(Dict):
+# Concurrent identical /recommendation requests share one graph run; finished
+# results are reused for RESULT_CACHE_TTL seconds (0 disables reuse)
+recommendation_flights = SingleFlight(result_ttl=float(os.getenv("RESULT_CACHE_TTL", "10")))
+
+def merge_timings(left: Dict[str, float], right: Dict[str, float]) -> Dict[str, float]:
+    return {**(left or {}), **(right or {})}
+
+# Define state to pass between agent types. Each node returns only the keys
+# it produces, so parallel branches write disjoint channels and are merged
+# by LangGraph when they join. Per-node timings from every branch are merged
+# into one dict by the merge_timings reducer.
+class AgentState(TypedDict, total=False):
     customer_id: str
+    mode: str
+    timings: Annotated[Dict[str, float], merge_timings]
     customer_profile: Dict[str, Any]
     purchase_patterns: Dict[str, Any]
     product_affinity: List[str]
     scored_opportunities: List[Dict[str, Any]]
     research_report: str
 
-# Define LangGraph nodes
-def customer_context_node(state: AgentState) -> Dict[str, Any]:
+# Define LangGraph nodes (async, so the graph never blocks the event loop)
+async def customer_context_node(state: AgentState) -> Dict[str, Any]:
     logger.debug("Customer context node: Fetching profile for ID %s", state["customer_id"])
-    profile = get_customer_profile(state["customer_id"])
-    state["customer_profile"] = profile
-    return state
-
-def purchase_pattern_node(state: AgentState) -> Dict[str, Any]:
-    logger.debug("Purchase pattern node: Analyzing patterns for customer ID %s", state["customer_profile"]["customer_id"])
-    customer_id = state["customer_profile"]["customer_id"]
-    patterns = analyze_purchase_patterns(customer_id)
+    profile = await aget_customer_profile(state["customer_id"], state.get("mode"))
+    return {"customer_profile": profile}
+
+async def purchase_pattern_node(state: AgentState) -> Dict[str, Any]:
+    logger.debug("Purchase pattern node: Analyzing patterns for customer ID %s", state["customer_id"])
+    patterns = await aanalyze_purchase_patterns(state["customer_id"], state.get("mode"))
     if "error" in patterns:
         logger.error("Purchase pattern error: %s", patterns["error"])
         raise ValueError(patterns["error"])
-    state["purchase_patterns"] = patterns
-    return state
+    return {"purchase_patterns": patterns}
 
-def product_affinity_node(state: AgentState) -> Dict[str, Any]:
+async def product_affinity_node(state: AgentState) -> Dict[str, Any]:
     logger.debug("Product affinity node: Generating suggestions for products %s", state["purchase_patterns"]["frequent_products"])
-    related = suggest_related_products(state["purchase_patterns"]["frequent_products"])
-    state["product_affinity"] = related
-    return state
+    related = await asuggest_related_products(state["purchase_patterns"]["frequent_products"], state.get("mode"))
+    return {"product_affinity": related}
 
-def opportunity_scoring_node(state: AgentState) -> Dict[str, Any]:
+async def opportunity_scoring_node(state: AgentState) -> Dict[str, Any]:
     logger.debug("Opportunity scoring node: Scoring %s and %s", state["purchase_patterns"]["missing_products"], state["product_affinity"])
-    scored = score_opportunities(
+    scored = await ascore_opportunities(
         state["purchase_patterns"]["missing_products"],
         state["product_affinity"],
-        state["customer_profile"].get("recent_purchases", [])  # Pass purchased products
+        state["customer_profile"].get("recent_purchases", []),  # Pass purchased products
+        state.get("mode"),
+        state["customer_id"]
     )
-    state["scored_opportunities"] = scored
-    return state
+    return {"scored_opportunities": scored}
 
-def recommendation_report_node(state: AgentState) -> Dict[str, Any]:
+async def recommendation_report_node(state: AgentState) -> Dict[str, Any]:
     logger.debug("Recommendation report node: Generating report for customer ID %s", state["customer_id"])
-    report = generate_research_report(
+    report = await agenerate_research_report(
         state["customer_profile"],
         state["purchase_patterns"],
-        state["scored_opportunities"]
+        state["scored_opportunities"],
+        state.get("mode")
     )
-    state["research_report"] = report
-    return state
+    return {"research_report": report}
 
 # Define the workflow
-workflow = StateGraph(AgentState)
-workflow.add_node("customer_context", customer_context_node)
-workflow.add_node("purchase_pattern", purchase_pattern_node)
-workflow.add_node("product_affinity_node", product_affinity_node)
-workflow.add_node("opportunity_scoring", opportunity_scoring_node)
-workflow.add_node("recommendation_report", recommendation_report_node)
-
-# Define edges
-workflow.add_edge("customer_context", "purchase_pattern")
-workflow.add_edge("purchase_pattern", "product_affinity_node")
-workflow.add_edge("product_affinity_node", "opportunity_scoring")
-workflow.add_edge("opportunity_scoring", "recommendation_report")
-workflow.add_edge("recommendation_report", END)
-
-# Set entry point and compile
-workflow.set_entry_point("customer_context")
-graph = workflow.compile()
-
-# FastAPI endpoint
-@app.get("/recommendation")
-async def recommendation(customer_id: str) -> Dict[str, Any]:
+def build_workflow(include_report: bool = True) -> StateGraph:
+    """
+    Builds the recommendation DAG. Without the report node the graph ends at
+    opportunity scoring, which the streaming endpoint uses before it streams
+    the report itself.
+    """
+    workflow = StateGraph(AgentState)
+    workflow.add_node("customer_context", instrument_node("customer_context", customer_context_node))
+    workflow.add_node("purchase_pattern", instrument_node("purchase_pattern", purchase_pattern_node))
+    workflow.add_node("product_affinity_node", instrument_node("product_affinity", product_affinity_node))
+    workflow.add_node("opportunity_scoring", instrument_node("opportunity_scoring", opportunity_scoring_node))
+
+    # Define edges: customer context runs alongside the purchase pattern ->
+    # product affinity branch, and opportunity scoring joins both branches.
+    workflow.add_edge(START, "customer_context")
+    workflow.add_edge(START, "purchase_pattern")
+    workflow.add_edge("purchase_pattern", "product_affinity_node")
+    workflow.add_edge(["customer_context", "product_affinity_node"], "opportunity_scoring")
+    if include_report:
+        workflow.add_node("recommendation_report", instrument_node("recommendation_report", recommendation_report_node))
+        workflow.add_edge("opportunity_scoring", "recommendation_report")
+        workflow.add_edge("recommendation_report", END)
+    else:
+        workflow.add_edge("opportunity_scoring", END)
+    return workflow
+
+# Compile
+graph = build_workflow().compile()
+scoring_graph = build_workflow(include_report=False).compile()
+
+async def run_pipeline(customer_id: str, mode: Optional[str] = None, include_timings: bool = False) -> Dict[str, Any]:
+    """
+    Runs the recommendation graph for one customer and shapes the API response.
+    mode (fast, hybrid or llm) defaults to $PIPELINE_MODE; include_timings adds a
+    per-node latency breakdown in milliseconds.
+    """
     try:
-        print(customer_id)
         logger.info("Received request for customer_id: %s", customer_id)
         # Initialize state and run
-        state = AgentState(customer_id=customer_id)
-        result = await graph.ainvoke(state)
+        mode = resolve_mode(mode)
+        state = AgentState(customer_id=customer_id, mode=mode)
+        start = time.perf_counter()
+        # All LLM calls of this run share one deadline ($LLM_REQUEST_BUDGET)
+        with request_budget():
+            result = await graph.ainvoke(state)
+        elapsed = time.perf_counter() - start
+        REQUEST_LATENCY.observe(elapsed, mode)
 
 
         logger.debug("Pipeline result: %s", result)
@@ -112,10 +182,261 @@ async def recommendation(customer_id: str) -> Dict[str, Any]:
 
         # Return response
         logger.info("Generated report successfully for customer_id: %s", customer_id)
-        return {
+        response = {
             "research_report": result["research_report"],
             "recommendations": result["scored_opportunities"]
         }
+        if include_timings:
+            response["timings"] = {**result.get("timings", {}), "total": round(elapsed * 1000, 3)}
+        return response
     except Exception as e:
         logger.error("Pipeline failed: %s", str(e))
-        return {"error": f"Pipeline failed: {str(e)}"}
\ No newline at end of file
+        return {"error": f"Pipeline failed: {str(e)}"}
+
+async def run_pipeline_batch(customer_ids: List[str], mode: Optional[str] = None, concurrency: int = 8) -> List[Dict[str, Any]]:
+    """
+    Runs the pipeline for a group of customers stage by stage, so product affinity
+    and opportunity scoring send one batched prompt per chunk of customers instead
+    of one call each. Results are returned in customer_ids order.
+    """
+    try:
+        mode = resolve_mode(mode)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def gather_inputs(customer_id: str):
+            async with semaphore:
+                return await asyncio.gather(
+                    aget_customer_profile(customer_id, mode),
+                    aanalyze_purchase_patterns(customer_id, mode)
+                )
+
+        inputs = await asyncio.gather(*[gather_inputs(customer_id) for customer_id in customer_ids])
+        results: Dict[str, Dict[str, Any]] = {}
+        ready: Dict[str, Any] = {}
+        for customer_id, (profile, patterns) in zip(customer_ids, inputs):
+            # Same precedence as the graph: a pattern error fails the run
+            if "error" in patterns:
+                results[customer_id] = {"error": f"Pipeline failed: {patterns['error']}"}
+            elif "error" in profile:
+                results[customer_id] = {"error": profile["error"]}
+            else:
+                ready[customer_id] = (profile, patterns)
+
+        affinity = await asuggest_related_products_batch(
+            {customer_id: patterns["frequent_products"] for customer_id, (_, patterns) in ready.items()},
+            mode
+        )
+        scored = await ascore_opportunities_batch(
+            {
+                customer_id: {
+                    "missing_products": patterns["missing_products"],
+                    "affinity_products": affinity[customer_id],
+                    "purchased_products": profile.get("recent_purchases", [])
+                }
+                for customer_id, (profile, patterns) in ready.items()
+            },
+            mode
+        )
+
+        async def report(customer_id: str) -> None:
+            profile, patterns = ready[customer_id]
+            async with semaphore:
+                text = await agenerate_research_report(profile, patterns, scored[customer_id], mode)
+            results[customer_id] = {"research_report": text, "recommendations": scored[customer_id]}
+
+        await asyncio.gather(*[report(customer_id) for customer_id in ready])
+        return [{"customer_id": customer_id, **results[customer_id]} for customer_id in customer_ids]
+    except Exception as e:
+        logger.error("Batch pipeline failed: %s", str(e))
+        return [{"customer_id": customer_id, "error": f"Pipeline failed: {str(e)}"} for customer_id in customer_ids]
+
+async def stream_recommendations(customer_ids: Optional[List[str]] = None, concurrency: int = 8, mode: Optional[str] = None, batch_prompts: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Runs the pipeline for many customers with bounded concurrency, yielding each
+    result as it finishes and a throughput summary last. Defaults to all customers.
+    With batch_prompts, customers are processed in groups of $BATCH_GROUP_SIZE
+    through run_pipeline_batch and each group is yielded when it completes.
+    """
+    store = get_store()
+    # Load the purchase data once up front so every run shares it
+    try:
+        all_customer_ids = await run_blocking(store.customer_ids)
+    except Exception as e:
+        logger.error("Purchase data unavailable: %s", str(e))
+        if customer_ids is None:
+            # No customers to run: report the failure in place of the results
+            yield {"error": f"Failed to load purchase data: {str(e)}"}
+            return
+        # Explicit IDs still run; each reports the data error as its own result
+        all_customer_ids = []
+    if customer_ids is None:
+        customer_ids = all_customer_ids
+
+    start = time.perf_counter()
+
+    async def run_groups() -> AsyncIterator[Dict[str, Any]]:
+        group_size = max(1, int(os.getenv("BATCH_GROUP_SIZE", "100")))
+        for offset in range(0, len(customer_ids), group_size):
+            for item in await run_pipeline_batch(customer_ids[offset:offset + group_size], mode, concurrency):
+                yield item
+
+    async def run_each() -> AsyncIterator[Dict[str, Any]]:
+        # A fixed pool of workers pulls IDs from a queue, so at most `concurrency`
+        # runs exist at a time; the bounded output queue holds the workers back
+        # while the client is slow to read
+        pending: asyncio.Queue = asyncio.Queue()
+        for customer_id in customer_ids:
+            pending.put_nowait(customer_id)
+        finished: asyncio.Queue = asyncio.Queue(maxsize=max(1, concurrency))
+
+        async def worker() -> None:
+            while not pending.empty():
+                customer_id = pending.get_nowait()
+                await finished.put({"customer_id": customer_id, **(await run_pipeline(customer_id, mode))})
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(max(1, concurrency), len(customer_ids)))]
+        try:
+            for _ in customer_ids:
+                yield await finished.get()
+        finally:
+            # Also runs when the client disconnects: stop the runs nobody will read
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    succeeded = 0
+    async with aclosing(run_groups() if batch_prompts else run_each()) as items:
+        async for item in items:
+            if "error" not in item:
+                succeeded += 1
+            yield item
+
+    elapsed = time.perf_counter() - start
+    yield {
+        "summary": {
+            "customers": len(customer_ids),
+            "succeeded": succeeded,
+            "failed": len(customer_ids) - succeeded,
+            "elapsed_seconds": round(elapsed, 3),
+            "customers_per_second": round(len(customer_ids) / elapsed, 3) if elapsed > 0 else None
+        }
+    }
+
+class BatchRequest(BaseModel):
+    customer_ids: Optional[List[str]] = None
+    concurrency: int = 8
+    mode: Optional[PipelineMode] = None
+    batch_prompts: bool = False
+
+# FastAPI endpoints
+# Fields a /recommendation caller can select with fields=; the error and the
+# staleness of a materialized result are returned whatever is selected
+RECOMMENDATION_FIELDS = ["research_report", "recommendations", "timings"]
+ALWAYS_RETURNED = ("error", "materialized")
+
+def without_age(content: Dict[str, Any]) -> Dict[str, Any]:
+    # age_seconds changes on every request, so it is left out of the ETag
+    if "materialized" not in content:
+        return content
+    staleness = {key: value for key, value in content["materialized"].items() if key != "age_seconds"}
+    return {**content, "materialized": staleness}
+
+@app.get("/recommendation")
+async def recommendation(request: Request, customer_id: str, mode: Optional[PipelineMode] = None, timings: bool = False, fresh: bool = False, fields: Optional[str] = None) -> Response:
+    """
+    Responses carry an ETag (If-None-Match gets a 304 while the result is
+    unchanged) and are compressed when large. fields=recommendations skips the
+    report text; selecting timings in fields implies timings=true.
+    """
+    try:
+        mode = resolve_mode(mode)
+        wanted = parse_fields(fields, RECOMMENDATION_FIELDS)
+    except ValueError as e:
+        return FastJSONResponse({"error": str(e)})
+    if wanted is not None and "timings" in wanted:
+        timings = True
+    if MATERIALIZE_RESULTS and not fresh and not timings and mode == resolve_mode():
+        precomputed = await materialized.get(customer_id)
+        if precomputed is not None:
+            content = project(precomputed, wanted, ALWAYS_RETURNED)
+            return conditional_json(request, content, without_age(content))
+    try:
+        data_version = await run_blocking(lambda: get_store().version)
+    except Exception as e:
+        logger.error("Purchase data unavailable: %s", str(e))
+        return FastJSONResponse({"error": f"Failed to load purchase data: {str(e)}"})
+    result = await recommendation_flights.do(
+        (customer_id, mode, PIPELINE_VERSION, data_version),
+        lambda: run_pipeline(customer_id, mode, include_timings=True),
+        cacheable=lambda value: "error" not in value
+    )
+    if not timings:
+        result = {key: value for key, value in result.items() if key != "timings"}
+    return conditional_json(request, project(dict(result), wanted, ALWAYS_RETURNED))
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def stream_report_events(customer_id: str, mode: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Yields Server-Sent Events: the scored opportunities as soon as scoring
+    finishes, then report text chunks as the model streams them, then done.
+    """
+    try:
+        mode = resolve_mode(mode)
+        with request_budget():
+            result = await scoring_graph.ainvoke(AgentState(customer_id=customer_id, mode=mode))
+        if "error" in result["customer_profile"]:
+            yield sse_event("error", {"error": result["customer_profile"]["error"]})
+            return
+        yield sse_event("opportunities", {"recommendations": result["scored_opportunities"]})
+
+        # The report stream gets its own budget: the client is already receiving data
+        with request_budget():
+            async for chunk in astream_research_report(
+                result["customer_profile"],
+                result["purchase_patterns"],
+                result["scored_opportunities"],
+                mode
+            ):
+                yield sse_event("report", {"text": chunk})
+        yield sse_event("done", {})
+    except Exception as e:
+        logger.error("Streaming pipeline failed: %s", str(e))
+        yield sse_event("error", {"error": f"Pipeline failed: {str(e)}"})
+
+@app.get("/recommendation/stream")
+async def recommendation_stream(customer_id: str, mode: Optional[PipelineMode] = None) -> StreamingResponse:
+    return StreamingResponse(
+        stream_report_events(customer_id, mode),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/recommendations/batch")
+async def recommendations_batch(request: BatchRequest) -> StreamingResponse:
+    async def ndjson() -> AsyncIterator[str]:
+        # aclosing passes a client disconnect on to stream_recommendations
+        async with aclosing(stream_recommendations(request.customer_ids, request.concurrency, request.mode, request.batch_prompts)) as items:
+            async for item in items:
+                yield json.dumps(item, default=str) + "\n"
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.get("/cache/stats")
+async def cache_stats() -> Dict[str, Any]:
+    cache = get_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/materialized/status")
+async def materialized_status() -> Dict[str, Any]:
+    return {"enabled": MATERIALIZE_RESULTS, **materialized.status()}
+
+@app.get("/llm/status")
+async def llm_status() -> Dict[str, Any]:
+    return {"provider": provider_name(), "circuit_breakers": breaker_states()}
@@ -0,0 +1,68 @@
+import argparse
+import logging
+import os
+import threading
+import time
+import pandas as pd
+import uvicorn
+from dotenv import load_dotenv
+
+from agents.arrow_store import export_arrow
+from agents.columnar_store import ParquetPurchaseStore
+from agents.data_store import DEFAULT_DATA_FILE
+
+logger = logging.getLogger(__name__)
+
+
+def _source_mtime(source: str) -> float:
+    if os.path.isdir(source):
+        return max(os.path.getmtime(os.path.join(root, name)) for root, _, names in os.walk(source) for name in names)
+    return os.path.getmtime(source)
+
+
+def export_if_stale(source: str, arrow_path: str) -> bool:
+    """
+    Re-exports the source data to the shared Arrow file when the source is newer.
+    """
+    if os.path.exists(arrow_path) and os.path.getmtime(arrow_path) >= _source_mtime(source):
+        return False
+    # Read outside the shared store cache so the parent does not keep a copy
+    df = ParquetPurchaseStore(source).frame() if os.path.isdir(source) else pd.read_csv(source)
+    rows = export_arrow(df, arrow_path)
+    logger.info("Exported %s rows from %s to %s", rows, source, arrow_path)
+    return True
+
+
+def watch(source: str, arrow_path: str, interval: float) -> None:
+    # Workers notice the replaced file by its mtime and remap it
+    while True:
+        time.sleep(interval)
+        try:
+            export_if_stale(source, arrow_path)
+        except Exception as e:
+            logger.error("Re-export of %s failed: %s", source, str(e))
+
+
+def main() -> None:
+    load_dotenv()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    parser = argparse.ArgumentParser(description="Serve the API from several workers sharing one memory-mapped copy of the purchase data.")
+    parser.add_argument("--data", default=os.getenv("DATA_FILE", DEFAULT_DATA_FILE), help="Purchase CSV or Parquet dataset (default: $DATA_FILE)")
+    parser.add_argument("--arrow", help="Shared Arrow file (default: <data>.arrow)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--refresh-interval", type=float, default=60, help="Seconds between source checks (0 disables)")
+    args = parser.parse_args()
+
+    arrow_path = args.arrow or args.data.rstrip("/") + ".arrow"
+    # The parent loads the data once; workers only map the exported file
+    export_if_stale(args.data, arrow_path)
+    os.environ["DATA_FILE"] = arrow_path
+    if args.refresh_interval > 0:
+        threading.Thread(target=watch, args=(args.data, arrow_path, args.refresh_interval), daemon=True).start()
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import asyncio
+import time
+import pytest
+from langchain_core.language_models.fake import FakeListLLM
+from benchmarks.fake_llm import LatencyFakeLLM
+from agents.llm_cache import LLMCache, MemoryCacheBackend, SQLiteCacheBackend, acached_invoke, cached_invoke, set_cache
+from agents.structured_output import ScoredOpportunities, conforms
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    cache = LLMCache(MemoryCacheBackend())
+    set_cache(cache)
+    yield cache
+    set_cache(None)
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_backend_evicts_least_recently_used(backend, tmp_path):
+    cache = MemoryCacheBackend(max_entries=2) if backend == "memory" else SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.set("a", "1", 60)
+    time.sleep(0.01)
+    cache.set("b", "2", 60)
+    time.sleep(0.01)
+    # Reading a makes b the least recently used entry
+    assert cache.get("a") == "1"
+    time.sleep(0.01)
+    cache.set("c", "3", 60)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+
+
+def test_expired_response_is_fetched_again(fresh_cache, monkeypatch):
+    monkeypatch.setenv("LLM_CACHE_TTL_TEST", "0.05")
+    llm = FakeListLLM(responses=["first", "second"])
+    assert cached_invoke(llm, "prompt", "test") == "first"
+    assert cached_invoke(llm, "prompt", "test") == "first"
+    time.sleep(0.1)
+    assert cached_invoke(llm, "prompt", "test") == "second"
+    assert fresh_cache.stats()["agents"]["test"] == {"hits": 1, "misses": 2}
+
+
+def test_sqlite_cache_survives_reopen(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    set_cache(LLMCache(SQLiteCacheBackend(path)))
+    assert cached_invoke(FakeListLLM(responses=["stored"]), "prompt", "test") == "stored"
+
+    # A new process opening the same file: answered from disk, the model is not called
+    set_cache(LLMCache(SQLiteCacheBackend(path)))
+    assert cached_invoke(FakeListLLM(responses=["fresh"]), "prompt", "test") == "stored"
+
+
+def accept_scores(text: str) -> bool:
+    return conforms(text, ScoredOpportunities)
+
+
+def test_rejected_response_is_not_cached(fresh_cache):
+    llm = LatencyFakeLLM(responses=["Sorry, I cannot help with that.", '[{"product": "Drills", "score": 0.7, "rationale": "r"}]'])
+    assert cached_invoke(llm, "prompt", "opportunity_scoring", accept=accept_scores).startswith("Sorry")
+    assert len(fresh_cache.backend) == 0
+    # The same prompt asks the model again and caches the valid answer
+    assert "Drills" in cached_invoke(llm, "prompt", "opportunity_scoring", accept=accept_scores)
+    assert len(fresh_cache.backend) == 1
+    assert "Drills" in cached_invoke(llm, "prompt", "opportunity_scoring", accept=accept_scores)
+    # Two model calls: FakeListLLM has wrapped back to its first response, not moved past it
+    assert llm.i == 0
+
+
+def test_async_rejected_response_is_not_cached(fresh_cache):
+    llm = LatencyFakeLLM(responses=['[{"product": "Drills", "score": 1.5, "rationale": "r"}]'])
+
+    async def run():
+        for _ in range(2):
+            await acached_invoke(llm, "prompt", "opportunity_scoring", accept=accept_scores)
+
+    asyncio.run(run())
+    assert len(fresh_cache.backend) == 0
+    assert fresh_cache.stats()["misses"] == 2
+
+
+def test_truncated_response_is_not_cached(fresh_cache):
+    # Repairable for the caller, but cut short: the next request asks again
+    llm = LatencyFakeLLM(responses=['[{"product": "Drills", "score": 0.7, "rationale": "r"}, {"product": "Glo'])
+    cached_invoke(llm, "prompt", "opportunity_scoring", accept=accept_scores)
+    assert len(fresh_cache.backend) == 0
@@ -0,0 +1,240 @@
+import asyncio
+import time
+import pytest
+from benchmarks.fake_llm import LatencyFakeLLM
+from agents import resilience
+from agents.resilience import (
+    CircuitOpenError,
+    DeadlineExceededError,
+    LLMUnavailableError,
+    ResiliencePolicy,
+    acall,
+    call,
+    get_breaker,
+    request_budget
+)
+
+KEY = "test-model"
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setenv("LLM_BREAKER_THRESHOLD", "2")
+    monkeypatch.setenv("LLM_BREAKER_RESET", "0.05")
+    resilience.reset_breakers()
+    yield
+    resilience.reset_breakers()
+
+
+class Counted:
+    """
+    Wraps fake LLMs as an acall/call attempt; the nth call goes to llms[n] (the
+    last one repeats) and every call is counted.
+    """
+
+    def __init__(self, *llms: LatencyFakeLLM):
+        self.llms = llms
+        self.calls = 0
+
+    def _next(self) -> LatencyFakeLLM:
+        llm = self.llms[min(self.calls, len(self.llms) - 1)]
+        self.calls += 1
+        return llm
+
+    def attempt(self):
+        return self._next().ainvoke("prompt")
+
+    def sync_attempt(self):
+        return self._next().invoke("prompt")
+
+
+def fake(latency: float = 0.0, error_rate: float = 0.0, response: str = "ok") -> LatencyFakeLLM:
+    return LatencyFakeLLM(responses=[response], latency=latency, error_rate=error_rate)
+
+
+def no_retry_policy(**overrides) -> ResiliencePolicy:
+    settings = {"timeout": 1.0, "retries": 0, "backoff": 0.0}
+    settings.update(overrides)
+    return ResiliencePolicy(**settings)
+
+
+def test_breaker_opens_after_consecutive_failures():
+    llm = Counted(fake(error_rate=1.0))
+    policy = no_retry_policy()
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(LLMUnavailableError):
+                await acall("test", KEY, llm.attempt, policy)
+        # Open: rejected without reaching the model
+        with pytest.raises(CircuitOpenError):
+            await acall("test", KEY, llm.attempt, policy)
+
+    asyncio.run(run())
+    assert llm.calls == 2
+    assert get_breaker(KEY).state == "open"
+
+
+def test_half_open_probe_closes_on_success_and_reopens_on_failure():
+    policy = no_retry_policy()
+    failing = Counted(fake(error_rate=1.0))
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(LLMUnavailableError):
+                await acall("test", KEY, failing.attempt, policy)
+        await asyncio.sleep(0.06)
+        assert get_breaker(KEY).state == "half_open"
+        # A failed probe opens the breaker again
+        with pytest.raises(LLMUnavailableError):
+            await acall("test", KEY, failing.attempt, policy)
+        assert get_breaker(KEY).state == "open"
+        await asyncio.sleep(0.06)
+        # A successful probe closes it
+        assert await acall("test", KEY, Counted(fake()).attempt, policy) == "ok"
+
+    asyncio.run(run())
+    assert get_breaker(KEY).state == "closed"
+
+
+def test_probe_that_runs_out_of_budget_reopens_the_breaker(monkeypatch):
+    policy = no_retry_policy(retries=1)
+    failing = Counted(fake(error_rate=1.0))
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(LLMUnavailableError):
+                await acall("test", KEY, failing.attempt, policy)
+        await asyncio.sleep(0.06)
+
+        # The probe's first attempt fails with budget left for a retry, then the
+        # budget is gone before the retry starts
+        left = iter([10.0, 10.0, 10.0])
+        monkeypatch.setattr(resilience, "remaining_budget", lambda: next(left, -1.0))
+        with pytest.raises(DeadlineExceededError):
+            await acall("test", KEY, failing.attempt, policy)
+        monkeypatch.undo()
+
+        # The probe slot was settled: after the reset timeout a new probe is admitted
+        assert get_breaker(KEY).state == "open"
+        await asyncio.sleep(0.06)
+        assert await acall("test", KEY, Counted(fake()).attempt, policy) == "ok"
+
+    asyncio.run(run())
+    assert get_breaker(KEY).state == "closed"
+
+
+def test_sync_probe_that_runs_out_of_budget_reopens_the_breaker(monkeypatch):
+    policy = no_retry_policy(retries=1)
+    failing = Counted(fake(error_rate=1.0))
+    for _ in range(2):
+        with pytest.raises(LLMUnavailableError):
+            call("test", KEY, failing.sync_attempt, policy)
+    time.sleep(0.06)
+
+    left = iter([10.0, 10.0, 10.0])
+    monkeypatch.setattr(resilience, "remaining_budget", lambda: next(left, -1.0))
+    with pytest.raises(DeadlineExceededError):
+        call("test", KEY, failing.sync_attempt, policy)
+    monkeypatch.undo()
+
+    time.sleep(0.06)
+    assert call("test", KEY, Counted(fake()).sync_attempt, policy) == "ok"
+    assert get_breaker(KEY).state == "closed"
+
+
+def test_provider_timeout_without_a_deadline_is_an_ordinary_failure():
+    # No per-call timeout and no budget: the TimeoutError is the provider's own
+    policy = no_retry_policy(timeout=0)
+
+    async def provider_timeout():
+        raise TimeoutError("read timed out")
+
+    def sync_provider_timeout():
+        raise TimeoutError("read timed out")
+
+    with pytest.raises(LLMUnavailableError) as excinfo:
+        asyncio.run(acall("test", KEY, provider_timeout, policy))
+    assert not isinstance(excinfo.value, DeadlineExceededError)
+    with pytest.raises(LLMUnavailableError) as excinfo:
+        call("test", KEY, sync_provider_timeout, policy)
+    assert not isinstance(excinfo.value, DeadlineExceededError)
+
+    # Both failures reached the breaker
+    assert get_breaker(KEY).state == "open"
+    time.sleep(0.06)
+    assert call("test", KEY, Counted(fake()).sync_attempt, policy) == "ok"
+    assert get_breaker(KEY).state == "closed"
+
+
+def test_hedge_wins_when_first_call_is_slow():
+    llm = Counted(fake(latency=2.0, response="slow"), fake(latency=0.0, response="fast"))
+    policy = no_retry_policy(timeout=5.0, hedge_delay=0.05)
+
+    async def run():
+        start = time.perf_counter()
+        result = await acall("test", KEY, llm.attempt, policy)
+        return result, time.perf_counter() - start
+
+    result, elapsed = asyncio.run(run())
+    assert result == "fast"
+    assert llm.calls == 2
+    assert elapsed < 1.0
+
+
+def test_sync_hedge_wins_when_first_call_is_slow():
+    llm = Counted(fake(latency=1.0, response="slow"), fake(latency=0.0, response="fast"))
+    policy = no_retry_policy(timeout=5.0, hedge_delay=0.05)
+    start = time.perf_counter()
+    assert call("test", KEY, llm.sync_attempt, policy) == "fast"
+    assert time.perf_counter() - start < 0.9
+
+
+def test_no_hedge_when_first_call_is_fast():
+    llm = Counted(fake(latency=0.0, response="first"), fake(response="second"))
+    policy = no_retry_policy(hedge_delay=0.2)
+    assert asyncio.run(acall("test", KEY, llm.attempt, policy)) == "first"
+    assert llm.calls == 1
+
+
+def test_request_budget_bounds_slow_calls_and_stops_later_ones():
+    llm = Counted(fake(latency=2.0))
+    policy = ResiliencePolicy(timeout=5.0, retries=2, backoff=0.0)
+
+    async def run():
+        with request_budget(0.1):
+            start = time.perf_counter()
+            with pytest.raises(DeadlineExceededError):
+                await acall("test", KEY, llm.attempt, policy)
+            elapsed = time.perf_counter() - start
+            calls = llm.calls
+            # Exhausted: the next call fails without reaching the model
+            with pytest.raises(DeadlineExceededError):
+                await acall("test", KEY, llm.attempt, policy)
+            return elapsed, calls
+
+    elapsed, calls = asyncio.run(run())
+    assert elapsed < 1.0
+    assert llm.calls == calls
+
+
+def test_nested_budget_never_extends_the_outer_one():
+    with request_budget(0.1):
+        with request_budget(10.0):
+            assert resilience.remaining_budget() <= 0.1
+    assert resilience.remaining_budget() is None
+
+
+def test_retries_recover_from_transient_failures():
+    llm = Counted(fake(error_rate=1.0), fake())
+    policy = ResiliencePolicy(timeout=1.0, retries=2, backoff=0.0)
+    assert asyncio.run(acall("test", KEY, llm.attempt, policy)) == "ok"
+    assert llm.calls == 2
+    assert get_breaker(KEY).state == "closed"
+
+
+def test_fake_llm_error_is_reported_as_unavailable():
+    llm = Counted(fake(error_rate=1.0))
+    with pytest.raises(LLMUnavailableError) as excinfo:
+        call("test", KEY, llm.sync_attempt, no_retry_policy())
+    assert "Injected LLM failure" in str(excinfo.value)
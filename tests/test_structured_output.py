@@ -0,0 +1,79 @@
+import pytest
+from agents.structured_output import (
+    PurchasePatterns,
+    ScoredOpportunities,
+    _balanced,
+    conforms,
+    conforms_keyed,
+    extract_json
+)
+
+SCORES = '[{"product": "Drills", "score": 0.7, "rationale": "r"}, {"product": "Gloves", "score": 0.5, "rationale": "r"}]'
+# Cut off inside the second opportunity, as when the model hits its token limit
+TRUNCATED = SCORES[:SCORES.index('"Gloves"') + 4]
+
+
+def test_valid_json_is_not_repaired():
+    assert extract_json(SCORES) == (ScoredOpportunities.model_validate_json(SCORES).model_dump(), False)
+
+
+@pytest.mark.parametrize("text", [
+    f"```json\n{SCORES}\n```",
+    f"Here are the scores:\n{SCORES}\nLet me know if you need more.",
+    f"```\n{SCORES}"
+])
+def test_fences_and_prose_are_stripped(text):
+    value, repaired = extract_json(text)
+    assert [item["product"] for item in value] == ["Drills", "Gloves"]
+    assert repaired
+
+
+def test_python_literal_dict_is_accepted():
+    value, repaired = extract_json("{'frequent_products': ['Drills'], 'missing_products': []}")
+    assert value == {"frequent_products": ["Drills"], "missing_products": []}
+    assert repaired
+
+
+def test_truncated_value_is_cut_back_to_its_last_complete_element():
+    value, repaired = extract_json(TRUNCATED)
+    assert [item["product"] for item in value] == ["Drills"]
+    assert repaired
+
+
+def test_truncated_value_is_rejected_when_not_allowed():
+    with pytest.raises(ValueError):
+        extract_json(TRUNCATED, allow_truncated=False)
+    # Fenced, complete output is still extracted
+    assert extract_json(f"```json\n{SCORES}\n```", allow_truncated=False)[1]
+
+
+def test_no_json_value_raises():
+    with pytest.raises(ValueError):
+        extract_json("I cannot help with that.")
+
+
+def test_balanced_ignores_brackets_inside_strings():
+    fragment = '{"rationale": "uses {braces} and [brackets] \\" here"} trailing'
+    assert _balanced(fragment) == fragment[:fragment.rindex("}") + 1]
+
+
+def test_balanced_closes_a_truncated_value_only_when_allowed():
+    assert _balanced('{"a": 1, "b": [1, 2') == '{"a": 1}'
+    assert _balanced('{"a": 1, "b": [1, 2', allow_truncated=False) is None
+    # Nothing complete to keep
+    assert _balanced('{"a": [1, 2') is None
+    assert _balanced("]") is None
+
+
+def test_conforms_rejects_truncated_but_accepts_wrapped_output():
+    assert not conforms(TRUNCATED, ScoredOpportunities)
+    assert conforms(f"Sure! ```json\n{SCORES}\n```", ScoredOpportunities)
+    assert not conforms('[{"product": "Drills", "score": 1.5, "rationale": "r"}]', ScoredOpportunities)
+
+
+def test_conforms_keyed_requires_a_complete_item_per_key():
+    item = '{"frequent_products": ["Drills"], "missing_products": []}'
+    complete = f'{{"C1": {item}, "C2": {item}}}'
+    assert conforms_keyed(complete, PurchasePatterns, ["C1", "C2"])
+    assert not conforms_keyed(complete, PurchasePatterns, ["C1", "C3"])
+    assert not conforms_keyed(complete[:-20], PurchasePatterns, ["C1"])